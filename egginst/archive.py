@@ -0,0 +1,45 @@
+import zipfile
+
+
+class Archive(object):
+    """
+    An egg (zip) archive, which is parsed once: the list of the member
+    names (in archive order), the set of member names and the map of the
+    member names to their ZipInfo objects are built when the archive is
+    opened, such that looking up members (e.g. when extracting, reading the
+    meta data, creating links and scripts or fixing object code) does not
+    require searching the member list each time.  Supports the methods of
+    zipfile.ZipFile which are used on eggs.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.z = zipfile.ZipFile(path)
+        infos = self.z.infolist()
+        self.names = [zip_info.filename for zip_info in infos]
+        self.members = set(self.names)
+        # for duplicate names, the last member wins, as in zipfile
+        self.infos = dict((zip_info.filename, zip_info) for zip_info in infos)
+
+    def __contains__(self, arcname):
+        return arcname in self.members
+
+    def namelist(self):
+        return list(self.names)
+
+    def getinfo(self, arcname):
+        return self.infos[arcname]
+
+    def size(self, arcname):
+        """
+        return the uncompressed size of the member arcname
+        """
+        return self.infos[arcname].file_size
+
+    def read(self, arcname):
+        return self.z.read(self.infos[arcname])
+
+    def open(self, arcname):
+        return self.z.open(self.infos[arcname])
+
+    def close(self):
+        self.z.close()
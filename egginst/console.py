@@ -1,4 +1,14 @@
 import sys
+import threading
+
+
+# Only one progress bar is drawn on the console at a time.  When several
+# operations run concurrently (e.g. fetching eggs), the others are
+# displayed in one piece once they are finished (and the console is free),
+# unless they failed.
+_lock = threading.Lock()
+_drawing = []
+_finished = []
 
 
 class ProgressManager(object):
@@ -11,17 +21,25 @@ class ProgressManager(object):
         self.disp_amount = disp_amount
         self._tot = steps
         self._cur = 0
+        self._deferred = False
+
+    def _header(self):
+        return ("%-56s %20s\n" % (self.filename, '[%s]' % self.action) +
+                '%9s [' % self.disp_amount)
 
     def __enter__(self):
         if self.silent:
             return
-        sys.stdout.write("%-56s %20s\n" % (self.filename,
-                                           '[%s]' % self.action))
-        sys.stdout.write('%9s [' % self.disp_amount)
-        sys.stdout.flush()
+        with _lock:
+            if _drawing:
+                self._deferred = True
+                return
+            _drawing.append(self)
+            sys.stdout.write(self._header())
+            sys.stdout.flush()
 
     def __call__(self, step=0):
-        if self.silent:
+        if self.silent or self._deferred:
             return
         if 0 < step < self._tot and 64.0 * step / self._tot > self._cur:
             sys.stdout.write('.')
@@ -31,6 +49,17 @@ class ProgressManager(object):
     def __exit__(self, exc_type, exc_value, exc_traceback):
         if self.silent:
             return
-        sys.stdout.write('.' * (65 - self._cur))
-        sys.stdout.write(']\n')
-        sys.stdout.flush()
+        with _lock:
+            if self._deferred:
+                # the bar of a failed operation was never drawn, and the
+                # error is reported instead
+                if exc_type is None:
+                    _finished.append(self._header() + 65 * '.' + ']\n')
+            else:
+                _drawing.remove(self)
+                sys.stdout.write('.' * (65 - self._cur))
+                sys.stdout.write(']\n')
+            if not _drawing:
+                sys.stdout.write(''.join(_finished))
+                del _finished[:]
+            sys.stdout.flush()
@@ -2,6 +2,8 @@ import json
 import time
 from os.path import join
 
+from archive import Archive
+
 
 def parse_rawspec(data):
     spec = {}
@@ -14,14 +16,19 @@ def parse_rawspec(data):
 
 
 def info_from_z(z):
+    """
+    return the info dictionary of an egg, given its Archive (or ZipFile)
+    object z
+    """
     res = dict(type='egg')
+    members = z.members if isinstance(z, Archive) else set(z.namelist())
 
     arcname = 'EGG-INFO/spec/depend'
-    if arcname in z.namelist():
+    if arcname in members:
         res.update(parse_rawspec(z.read(arcname)))
 
     arcname = 'EGG-INFO/info.json'
-    if arcname in z.namelist():
+    if arcname in members:
         res.update(json.loads(z.read(arcname)))
 
     res['name'] = res['name'].lower().replace('-', '_')
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import threading
+from subprocess import Popen, call
+from os.path import dirname, isfile
+
+from utils import on_win
+
+
+# run by the helper interpreter, which reads the hooks to run from the
+# file descriptor given as the first argument (one JSON list [path, prefix]
+# per line), runs each one as the script __main__ in its own directory, and
+# writes its exit status to the file descriptor given as the second
+# argument (the hooks themselves get /dev/null as stdin); the state of the
+# interpreter which hooks commonly change is restored after each hook
+HELPER_CODE = """\
+import os, sys, json, fcntl, atexit, signal, traceback
+fds = [int(a) for a in sys.argv[1:3]]
+for fd in fds:
+    # not inherited by the processes started by the hooks
+    fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) |
+                                   fcntl.FD_CLOEXEC)
+cmd = os.fdopen(fds[0], 'r')
+out = os.fdopen(fds[1], 'w')
+del sys.argv[1:]
+cwd = os.getcwd()
+sys_path = list(sys.path)
+modules = set(sys.modules)
+environ = dict(os.environ)
+streams = sys.stdin, sys.stdout, sys.stderr
+signums = [n for n in range(1, signal.NSIG) if signal.getsignal(n) is not None]
+handlers = dict((n, signal.getsignal(n)) for n in signums)
+
+def run_exitfuncs(n):
+    # run (like at exit) the functions the hook registered with atexit
+    while len(atexit._exithandlers) > n:
+        func, targs, kargs = atexit._exithandlers.pop()
+        try:
+            func(*targs, **kargs)
+        except SystemExit:
+            pass
+        except:
+            traceback.print_exc()
+
+while True:
+    line = cmd.readline()
+    if not line:
+        break
+    path, prefix = [s.encode('utf-8') for s in json.loads(line)]
+    sys.argv[:] = [path, '--prefix', prefix]
+    sys.path[:] = [os.path.dirname(path)] + sys_path[1:]
+    n_exitfuncs = len(atexit._exithandlers)
+    status = 0
+    try:
+        os.chdir(os.path.dirname(path))
+        execfile(path, {'__name__': '__main__', '__file__': path,
+                        '__builtins__': __builtins__})
+    except SystemExit, e:
+        if isinstance(e.code, (int, long)):
+            status = e.code
+        elif e.code is not None:
+            sys.stderr.write('%s\\n' % e.code)
+            status = 1
+    except:
+        traceback.print_exc()
+        status = 1
+    run_exitfuncs(n_exitfuncs)
+    for f in sys.stdout, sys.stderr:
+        try:
+            f.flush()
+        except Exception:
+            pass
+    sys.stdin, sys.stdout, sys.stderr = streams
+    # modules imported by one hook are not seen by the next one
+    for name in set(sys.modules) - modules:
+        del sys.modules[name]
+    if os.environ != environ:
+        os.environ.clear()
+        os.environ.update(environ)
+    for n in signums:
+        if signal.getsignal(n) is not handlers[n]:
+            signal.signal(n, handlers[n])
+    os.chdir(cwd)
+    out.write('%d\\n' % status)
+    out.flush()
+"""
+
+
+class HookRunner(object):
+    """
+    Runs the hooks of eggs (post_egginst.py and pre_egguninst.py) in one
+    long-lived helper interpreter, instead of starting a new interpreter
+    for each hook.  As before, each hook is run with its directory as the
+    current directory and the arguments '--prefix <prefix>', and an error
+    in one hook does not affect the others (the helper is restarted when
+    a hook makes it exit).  The modules a hook imports, its changes to
+    os.environ, sys.argv, sys.path, the standard streams and the signal
+    handlers are undone, and its atexit functions are run, after the hook.
+    Hooks which are deferred are run by flush.
+    On Windows, each hook is still run by its own interpreter.
+
+    The runner is meant to be used as a context manager, which flushes the
+    deferred hooks and stops the helper on exit.
+    """
+    def __init__(self, executable=sys.executable):
+        self.executable = executable
+        # list of tuples(key, path, prefix) of the deferred hooks
+        self.pending = []
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        finally:
+            self.close()
+
+    def _start(self):
+        import fcntl
+        cmd_r, cmd_w = os.pipe()
+        status_r, status_w = os.pipe()
+        # only the helper's ends of the pipes are inherited by it
+        for fd in cmd_w, status_r:
+            fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) |
+                                           fcntl.FD_CLOEXEC)
+        with open(os.devnull) as devnull:
+            self._proc = Popen([self.executable, '-E', '-c', HELPER_CODE,
+                                str(cmd_r), str(status_w)], stdin=devnull)
+        os.close(cmd_r)
+        os.close(status_w)
+        self._cmd = os.fdopen(cmd_w, 'w')
+        self._status = os.fdopen(status_r)
+
+    def _stop(self):
+        try:
+            self._cmd.close()
+        except IOError:
+            # the helper is gone already
+            pass
+        self._proc.wait()
+        self._status.close()
+        self._proc = None
+
+    def run(self, path, prefix):
+        """
+        run the hook at path for prefix now, and return its exit status
+        """
+        if on_win:
+            return call([self.executable, '-E', path, '--prefix', prefix],
+                        cwd=dirname(path))
+        with self._lock:
+            if self._proc is None:
+                self._start()
+            # the output of the hook follows the output so far
+            sys.stdout.flush()
+            try:
+                self._cmd.write(json.dumps([path, prefix]) + '\n')
+                self._cmd.flush()
+            except IOError:
+                line = ''
+            else:
+                line = self._status.readline()
+            if not line:
+                # the helper exited in the hook
+                self._stop()
+                return 1
+            return int(line)
+
+    def defer(self, path, prefix, key=None):
+        """
+        run the hook at path for prefix, when flush is called, where key
+        (e.g. the egg filename) determines the order of the hooks
+        """
+        with self._lock:
+            self.pending.append((key, path, prefix))
+
+    def flush(self, keys=None):
+        """
+        run the deferred hooks, in the order of their keys in the list keys
+        (hooks with other keys come last), or in the order in which they
+        were deferred when keys is not given
+        """
+        with self._lock:
+            pending, self.pending = self.pending, []
+        if keys is not None:
+            index = dict((key, i) for i, key in enumerate(keys))
+            # (the sort is stable)
+            pending.sort(key=lambda item: index.get(item[0], len(keys)))
+        for key, path, prefix in pending:
+            if isfile(path):
+                self.run(path, prefix)
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None:
+                self._stop()
@@ -0,0 +1,156 @@
+import os
+import json
+import threading
+from os.path import isdir, isfile, join
+
+from utils import on_win, rm_rf
+
+
+# serializes the updates of the databases, as eggs may be installed (into
+# the same directory) by several threads
+_lock = threading.RLock()
+
+
+def _read_json(path):
+    try:
+        with open(path) as fi:
+            return json.load(fi)
+    except (IOError, ValueError):
+        return None
+
+
+class InstallDB(object):
+    """
+    Database of the packages installed into a directory of package meta
+    data directories, i.e. <prefix>/EGG-INFO (or <prefix>/pkgs, for hook
+    installs), such that querying the installed packages does not require
+    reading the meta data files of every package.
+
+    The database is a JSON file next to the directory, which maps the names
+    of the entries of the directory to a dictionary with the 'egg_name'
+    (from egginst.json) and the 'info' (from _info.json), both of which are
+    None when the file does not exist.  It is updated by EggInst whenever
+    a package is installed or removed.  The modification time and the
+    listing of the directory, and the size and modification time of the
+    meta data files of each entry, are stored along with the entries, and
+    when they change by other means (e.g. a package was installed by an
+    older version of egginst, or its _info.json was rewritten), the
+    database is rebuilt from the meta data files.
+    """
+    def __init__(self, dir_path, meta_subdir=None):
+        self.dir_path = dir_path
+        self.meta_subdir = meta_subdir
+        self.path = dir_path.rstrip('/\\') + '-index.json'
+        # tuple(stamp, file stamp, entries) of the database last read or
+        # written by this object
+        self._cache = None
+
+    def meta_dir(self, fn):
+        """
+        return the meta data directory for an entry of the directory
+        """
+        if self.meta_subdir:
+            return join(self.dir_path, fn, self.meta_subdir)
+        return join(self.dir_path, fn)
+
+    def _stamp(self):
+        try:
+            names = sorted(os.listdir(self.dir_path))
+            return [os.stat(self.dir_path).st_mtime, names,
+                    dict((fn, self._entry_stamp(fn)) for fn in names)]
+        except OSError:
+            return None
+
+    def _entry_stamp(self, fn):
+        res = []
+        for name in 'egginst.json', '_info.json':
+            try:
+                st = os.stat(join(self.meta_dir(fn), name))
+                res.append([st.st_size, st.st_mtime])
+            except OSError:
+                res.append(None)
+        return res
+
+    def _file_stamp(self):
+        # the database might have been updated by another object
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size, st.st_ino
+
+    def _read_entry(self, fn):
+        meta_dir = self.meta_dir(fn)
+        meta = _read_json(join(meta_dir, 'egginst.json'))
+        return dict(egg_name=meta.get('egg_name') if meta else None,
+                    info=_read_json(join(meta_dir, '_info.json')))
+
+    def _write(self, stamp, entries):
+        self._cache = None
+        if stamp is None:
+            rm_rf(self.path)
+            return
+        tmp_path = self.path + '.part'
+        try:
+            with open(tmp_path, 'w') as fo:
+                json.dump(dict(stamp=stamp, entries=entries), fo)
+            if on_win and isfile(self.path):
+                os.remove(self.path)
+            os.rename(tmp_path, self.path)
+            self._cache = stamp, self._file_stamp(), entries
+        except (IOError, OSError):
+            # the database is only an optimization, e.g. a prefix which is
+            # not writable is simply always read from the meta data files
+            pass
+
+    def entries(self):
+        """
+        return a dictionary mapping the entries of the directory to
+        dictionaries with the 'egg_name' and 'info' of the package
+        """
+        stamp = self._stamp()
+        if stamp is None:
+            return {}
+        file_stamp = self._file_stamp()
+        if self._cache and self._cache[:2] == (stamp, file_stamp):
+            return self._cache[2]
+        with _lock:
+            data = _read_json(self.path)
+            if data and data.get('stamp') == stamp:
+                self._cache = stamp, file_stamp, data['entries']
+                return data['entries']
+            entries = dict((fn, self._read_entry(fn)) for fn in stamp[1])
+            self._write(stamp, entries)
+            return entries
+
+    def update(self, fn):
+        """
+        update the database after the package with the given entry (of the
+        directory) was installed or removed
+        """
+        with _lock:
+            self._update(fn)
+
+    def _update(self, fn):
+        data = _read_json(self.path)
+        stamp = self._stamp()
+
+        def others(stamp):
+            # the stamps of the other entries
+            return dict((k, v) for k, v in stamp[2].iteritems() if k != fn)
+
+        if (data is None or stamp is None or len(data['stamp']) != 3 or
+                (set(data['stamp'][1]) ^ set(stamp[1])) - set([fn]) or
+                others(data['stamp']) != others(stamp)):
+            # other entries have changed as well (or there is no database)
+            if stamp is None:
+                self._write(None, None)
+            else:
+                self.entries()
+            return
+        entries = data['entries']
+        if isdir(self.meta_dir(fn)):
+            entries[fn] = self._read_entry(fn)
+        else:
+            entries.pop(fn, None)
+        self._write(stamp, entries)
@@ -11,14 +11,33 @@ import os
 import sys
 import re
 import json
+import Queue
 import zipfile
+import tempfile
+import threading
 from uuid import uuid4
-from os.path import abspath, basename, dirname, join, isdir, isfile, sep
+from os.path import (abspath, basename, dirname, join, isdir, isfile, islink,
+                     sep)
 
 from utils import (on_win, bin_dir_name, rel_site_packages, human_bytes,
                    rm_empty_dir, rm_rf, get_executable, makedirs, is_zipinfo_symlink)
+from object_code import object_type_from_head
 import scripts
-
+from archive import Archive
+from installdb import InstallDB
+from unpacked import UnpackedStore
+
+
+# run by each process compiling Python files, which reads the paths of
+# the files from stdin (files which fail to compile are skipped)
+COMPILE_CODE = """\
+import sys, py_compile
+for path in sys.stdin:
+    try:
+        py_compile.compile(path.rstrip('\\n'), doraise=True)
+    except Exception:
+        pass
+"""
 
 NS_PKG_PAT = re.compile(
     r'\s*__import__\([\'"]pkg_resources[\'"]\)\.declare_namespace'
@@ -40,7 +59,8 @@ class EggInst(object):
 
     def __init__(self, path, prefix=sys.prefix,
                  hook=False, pkgs_dir=None, evt_mgr=None,
-                 verbose=False, noapp=False):
+                 verbose=False, noapp=False, extract_workers=1,
+                 store_dir=None, compile_workers=0):
         self.path = path
         self.fn = basename(path)
         name, version = name_version_fn(self.fn)
@@ -49,6 +69,17 @@ class EggInst(object):
         self.hook = bool(hook)
         self.evt_mgr = evt_mgr
         self.noapp = noapp
+        # the number of threads writing the members of the archive
+        self.extract_workers = extract_workers
+        # the files are linked from the unpacked egg in this store, if any
+        self.store = UnpackedStore(store_dir) if store_dir else None
+        self.unpacked = None
+        # the number of processes byte-compiling the Python files after
+        # installing, 0 means the files are not compiled
+        self.compile_workers = compile_workers
+        # the HookRunner running the hooks of the egg, if any (otherwise
+        # each hook is run by a new interpreter)
+        self.hooks = None
 
         self.bin_dir = join(self.prefix, bin_dir_name)
 
@@ -64,14 +95,21 @@ class EggInst(object):
             self.pyloc = self.pkg_dir
             self.meta_dir = join(self.pkg_dir, 'EGG-INFO')
             self.registry_txt = join(self.meta_dir, 'registry.txt')
+            self.db = InstallDB(self.pkgs_dir, 'EGG-INFO')
+            self.db_entry = basename(self.pkg_dir)
         else:
             self.site_packages = join(self.prefix, rel_site_packages)
             self.pyloc = self.site_packages
             self.egginfo_dir = join(self.prefix, 'EGG-INFO')
             self.meta_dir = join(self.egginfo_dir, self.cname)
+            self.db = InstallDB(self.egginfo_dir)
+            self.db_entry = self.cname
 
         self.meta_json = join(self.meta_dir, 'egginst.json')
         self.files = []
+        # maps the paths of the files written to their object file type
+        # (or None), which is determined from the data being written
+        self.object_types = {}
         self.verbose = verbose
 
 
@@ -79,8 +117,12 @@ class EggInst(object):
         if not isdir(self.meta_dir):
             os.makedirs(self.meta_dir)
 
-        self.z = zipfile.ZipFile(self.path)
-        self.arcnames = self.z.namelist()
+        self.z = Archive(self.path)
+        self.arcnames = self.z.names
+        if self.store:
+            # tuple(directory, members) of the unpacked egg
+            self.unpacked = self.store.get(self.z, self.fn,
+                                           self.is_executable)
         self.extract()
 
         if on_win:
@@ -95,8 +137,8 @@ class EggInst(object):
 
         if not self.hook:
             self.entry_points()
-        if ('EGG-INFO/spec/depend' in self.arcnames  or
-            'EGG-INFO/info.json' in self.arcnames):
+        if ('EGG-INFO/spec/depend' in self.z  or
+            'EGG-INFO/info.json' in self.z):
             import eggmeta
             info = eggmeta.create_info(self, extra_info)
         else:
@@ -106,11 +148,14 @@ class EggInst(object):
         if not self.hook:
             scripts.fix_scripts(self)
             self.install_app()
+        if self.compile_workers > 0:
+            self.compile_files()
         self.write_meta()
 
         if self.hook:
             import registry
             registry.create_file(self)
+        self.db.update(self.db_entry)
 
         if info.get('app'):
             import app_entry
@@ -135,6 +180,37 @@ class EggInst(object):
             scripts.create(self, conf)
 
 
+    def compile_files(self):
+        """
+        byte-compile the Python modules installed by the egg (unless the
+        egg contains their .pyc files) using several processes of the
+        Python interpreter of the prefix, and add the .pyc files to the
+        installed files (such that they are removed with the egg)
+        """
+        files = set(self.files)
+        paths = [p for p in self.files
+                 if p.endswith('.py') and p + 'c' not in files and
+                    p.startswith(self.pyloc + sep) and
+                    not p.startswith(self.meta_dir + sep) and
+                    isfile(p) and not islink(p)]
+        if not paths:
+            return
+        if self.verbose:
+            print 'compiling %d files' % len(paths)
+        from subprocess import Popen
+        n = min(self.compile_workers, len(paths))
+        procs = []
+        for i in xrange(n):
+            fi = tempfile.TemporaryFile()
+            fi.write(''.join(p + '\n' for p in paths[i::n]))
+            fi.seek(0)
+            procs.append(Popen([scripts.executable, '-E', '-c', COMPILE_CODE],
+                               stdin=fi))
+            fi.close()
+        for proc in procs:
+            proc.wait()
+        self.files.extend(p + 'c' for p in paths if isfile(p + 'c'))
+
     def rel_prefix(self, path):
         return abspath(path).replace(self.prefix, '.').replace('\\', '/')
 
@@ -157,7 +233,7 @@ class EggInst(object):
 
 
     def lines_from_arcname(self, arcname, ignore_empty=True):
-        if not arcname in self.arcnames:
+        if not arcname in self.z:
             return
         for line in self.z.read(arcname).splitlines():
             line = line.strip()
@@ -175,7 +251,7 @@ class EggInst(object):
             from console import ProgressManager
 
         n = 0
-        size = sum(self.z.getinfo(name).file_size for name in self.arcnames)
+        size = sum(self.z.size(name) for name in self.arcnames)
         self.installed_size = size
         progress = ProgressManager(
                 self.evt_mgr, source=self,
@@ -187,11 +263,126 @@ class EggInst(object):
                 disp_amount=human_bytes(self.installed_size),
                 super_id=getattr(self, 'super_id', None))
         with progress:
+            if self.extract_workers > 1 and self.unpacked is None:
+                self.extract_parallel(progress)
+                return
             for name in self.arcnames:
-                n += self.z.getinfo(name).file_size
-                self.write_arcname(name)
+                self.write_arcname(name, lambda k, n=n: progress(step=n + k))
+                n += self.z.size(name)
                 progress(step=n)
 
+    def extract_parallel(self, progress):
+        """
+        Extract the archive using several threads (each with its own
+        ZipFile object).  All directories are created up front.  Symbolic
+        links are created afterwards (in archive order), followed by the
+        members which are written through one of these links.
+        """
+        n = 0
+        tasks = []
+        link_names = []
+        for arcname in self.arcnames:
+            if arcname.endswith('/') or arcname.startswith('.unused'):
+                task = None
+            elif is_zipinfo_symlink(self.z.getinfo(arcname)):
+                link_names.append((arcname, self.get_dst(arcname)))
+                self.files.append(link_names[-1][1])
+                continue
+            else:
+                task = self.file_task(arcname)
+            if task is None:
+                n += self.z.size(arcname)
+                continue
+            self.files.append(task[1])
+            tasks.append(task)
+
+        links = set(link_name for arcname, link_name in link_names)
+        deferred = []
+        # maps paths to tasks, such that later members replace earlier
+        # members with the same path, as they do when extracting in order
+        parallel = {}
+        for task in tasks:
+            dn = dirname(task[1])
+            while links and dn != dirname(dn) and dn not in links:
+                dn = dirname(dn)
+            if dn in links:
+                deferred.append(task)
+            else:
+                parallel[task[1]] = task
+        # the dictionary does not keep the order
+        parallel = [task for task in tasks if parallel.get(task[1]) is task]
+
+        for dn in sorted(set(dirname(task[1]) for task in parallel)):
+            if not isdir(dn):
+                makedirs(dn)
+        n = self._write_parallel(parallel, progress, n)
+
+        for arcname, link_name in link_names:
+            self.extract_symlink(arcname)
+            n += self.z.size(arcname)
+            progress(step=n)
+        for task in deferred:
+            self.write_file(self.z, *task)
+            n += self.z.size(task[0])
+            progress(step=n)
+
+    def _write_parallel(self, tasks, progress, n):
+        todo = Queue.Queue()
+        for task in tasks:
+            todo.put(task)
+        # tuples(arcname, bytes written, exc_info), where the number of
+        # bytes is None once the member is written (or failed)
+        done = Queue.Queue()
+
+        def worker():
+            z = zipfile.ZipFile(self.path)
+            try:
+                while True:
+                    try:
+                        task = todo.get_nowait()
+                    except Queue.Empty:
+                        return
+                    report = lambda k, a=task[0]: done.put((a, k, None))
+                    try:
+                        self.write_file(z, *task, report=report)
+                    except Exception:
+                        done.put((task[0], None, sys.exc_info()))
+                        return
+                    done.put((task[0], None, None))
+            finally:
+                z.close()
+
+        threads = [threading.Thread(target=worker)
+                   for i in xrange(min(self.extract_workers, len(tasks)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        # maps the members being written to the number of bytes written
+        partial = {}
+        try:
+            finished = 0
+            while finished < len(tasks):
+                arcname, k, exc_info = done.get()
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if k is None:
+                    finished += 1
+                    partial.pop(arcname, None)
+                    n += self.z.size(arcname)
+                else:
+                    partial[arcname] = k
+                progress(step=n + sum(partial.itervalues()))
+        finally:
+            # make the remaining workers stop, when an error occurred
+            while True:
+                try:
+                    todo.get_nowait()
+                except Queue.Empty:
+                    break
+            for t in threads:
+                t.join()
+        return n
+
 
     def get_dst(self, arcname):
         if (not self.hook and arcname == 'EGG-INFO/PKG-INFO' and
@@ -223,7 +414,7 @@ class EggInst(object):
     py_pat = re.compile(r'^(.+)\.py(c|o)?$')
     so_pat = re.compile(r'^lib.+\.so')
     py_obj = '.pyd' if on_win else '.so'
-    def write_arcname(self, arcname):
+    def write_arcname(self, arcname, report=None):
         if arcname.endswith('/') or arcname.startswith('.unused'):
             return
         zip_info = self.z.getinfo(arcname)
@@ -232,31 +423,118 @@ class EggInst(object):
             self.files.append(link_name)
             return
 
+        task = self.file_task(arcname)
+        if task is None:
+            return
+        self.files.append(task[1])
+        if self.unpacked and task[2] is None:
+            self.link_file(*task)
+        else:
+            self.write_file(self.z, *task, report=report)
+
+    def file_task(self, arcname):
+        """
+        return tuple(arcname, path, data, executable) for writing the
+        (regular) archive member arcname, where data is None when the
+        member is written unchanged, or None if it is not written at all
+        """
         m = self.py_pat.match(arcname)
-        if m and (m.group(1) + self.py_obj) in self.arcnames:
+        if m and (m.group(1) + self.py_obj) in self.z:
             # .py, .pyc, .pyo next to .so are not written
-            return
+            return None
         path = self.get_dst(arcname)
         dn, fn = os.path.split(path)
-        data = self.z.read(arcname)
+        data = None
         if fn in ['__init__.py', '__init__.pyc']:
             tmp = arcname.rstrip('c')
-            if tmp in self.arcnames and NS_PKG_PAT.match(self.z.read(tmp)):
+            if tmp in self.z and NS_PKG_PAT.match(self.z.read(tmp)):
                 if fn == '__init__.py':
                     data = ''
                 if fn == '__init__.pyc':
-                    return
-        self.files.append(path)
+                    return None
+        return arcname, path, data, self.is_executable(arcname)
+
+    def is_executable(self, arcname):
+        """
+        return whether the archive member arcname is installed as an
+        executable file
+        """
+        fn = arcname.split('/')[-1]
+        return bool(
+            arcname.startswith(('EGG-INFO/usr/bin/', 'EGG-INFO/scripts/')) or
+            fn.endswith(('.dylib', '.pyd', '.so')) or
+            (arcname.startswith('EGG-INFO/usr/lib/') and
+             self.so_pat.match(fn)))
+
+    # members larger than this are written in chunks of this size, such
+    # that they are never read into memory as a whole
+    chunk_size = 2 ** 18
+
+    def write_file(self, z, arcname, path, data, executable, report=None):
+        """
+        write the archive member arcname (read from the ZipFile object z,
+        unless data is given) to path, while large members are written,
+        report (if given) is called with the number of bytes written
+        """
+        dn = dirname(path)
         if not isdir(dn):
-            os.makedirs(dn)
+            makedirs(dn)
         rm_rf(path)
-        fo = open(path, 'wb')
-        fo.write(data)
-        fo.close()
-        if (arcname.startswith(('EGG-INFO/usr/bin/', 'EGG-INFO/scripts/')) or
-                fn.endswith(('.dylib', '.pyd', '.so')) or
-                (arcname.startswith('EGG-INFO/usr/lib/') and
-                 self.so_pat.match(fn))):
+        if data is None and z.getinfo(arcname).file_size > self.chunk_size:
+            fi = z.open(arcname)
+            try:
+                with open(path, 'wb') as fo:
+                    n = 0
+                    while True:
+                        chunk = fi.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        if n == 0:
+                            self.object_types[path] = object_type_from_head(
+                                path, chunk)
+                        fo.write(chunk)
+                        n += len(chunk)
+                        if report:
+                            report(n)
+            finally:
+                fi.close()
+        else:
+            if data is None:
+                data = z.read(arcname)
+            self.object_types[path] = object_type_from_head(path, data)
+            with open(path, 'wb') as fo:
+                fo.write(data)
+        if executable:
+            os.chmod(path, 0755)
+
+
+    def link_file(self, arcname, path, data, executable):
+        """
+        install the archive member arcname as path from the unpacked egg,
+        where files which are (or might be) changed in the prefix are
+        copied, as the linked files are shared by all prefixes
+        """
+        dir_path, members = self.unpacked
+        member = members[arcname]
+        src = join(dir_path, *arcname.split('/'))
+        dn = dirname(path)
+        if not isdir(dn):
+            makedirs(dn)
+        rm_rf(path)
+        copy = bool(member['placeholders'] or
+                    # scripts are rewritten, and the meta data directory
+                    # contains the hooks, which may write next to them
+                    path.startswith((self.bin_dir + sep,
+                                     self.meta_dir + sep)) or
+                    # the mode of a link is the mode of the file in the store
+                    UnpackedStore.mode(executable) !=
+                        os.stat(src).st_mode & 0777)
+        # object files without placeholders do not need to be fixed
+        if member['placeholders']:
+            self.object_types[path] = member['object_type']
+        else:
+            self.object_types[path] = None
+        if not UnpackedStore.link(src, path, copy) and executable:
             os.chmod(path, 0755)
 
 
@@ -287,6 +565,13 @@ class EggInst(object):
         path = join(self.meta_dir, fn)
         if not isfile(path):
             return
+        if self.hooks is not None:
+            if fn == 'post_egginst.py':
+                self.hooks.defer(path, self.prefix, self.fn)
+            else:
+                # the files are still needed by the hook
+                self.hooks.run(path, self.prefix)
+            return
         from subprocess import call
         call([sys.executable, '-E', path, '--prefix', self.prefix],
              cwd=dirname(path))
@@ -345,6 +630,7 @@ class EggInst(object):
                 rm_empty_dir(self.pkg_dir)
             else:
                 rm_empty_dir(self.egginfo_dir)
+            self.db.update(self.db_entry)
 
 
 def read_meta(meta_dir):
@@ -360,17 +646,15 @@ def get_installed(prefix=sys.prefix):
     Each element is the filename of the egg which was used to install the
     package.
     """
-    egg_info_dir = join(prefix, 'EGG-INFO')
-    if not isdir(egg_info_dir):
-        return
+    entries = InstallDB(join(prefix, 'EGG-INFO')).entries()
     pat = re.compile(r'([a-z0-9_.]+)$')
-    for fn in sorted(os.listdir(egg_info_dir)):
+    for fn in sorted(entries):
         if not pat.match(fn):
             continue
-        d = read_meta(join(egg_info_dir, fn))
-        if d is None:
+        egg_name = entries[fn]['egg_name']
+        if egg_name is None:
             continue
-        yield d['egg_name']
+        yield egg_name
 
 
 def print_installed(prefix=sys.prefix):
@@ -415,6 +699,30 @@ def main():
                  action="store_true",
                  help="remove package(s), requires the egg or project name(s)")
 
+    p.add_option("--workers",
+                 action="store",
+                 type="int",
+                 default=1,
+                 help="number of threads extracting an egg, "
+                      "defaults to %default",
+                 metavar='N')
+
+    p.add_option("--compile",
+                 action="store",
+                 type="int",
+                 default=0,
+                 help="number of processes byte-compiling the Python files "
+                      "after installing, defaults to %default (no compiling)",
+                 metavar='N')
+
+    p.add_option("--store",
+                 action="store",
+                 help="directory of unpacked eggs, from which the files are "
+                      "hardlinked into the prefix; linked files are shared "
+                      "by all prefixes using the store and are read-only, "
+                      "so they must be replaced (not changed) in a prefix",
+                 metavar='PATH')
+
     p.add_option('-v', "--verbose", action="store_true")
     p.add_option('--version', action="store_true")
 
@@ -442,7 +750,9 @@ def main():
 
     for path in args:
         ei = EggInst(path, prefix, opts.hook, opts.pkgs_dir, evt_mgr,
-                     verbose=opts.verbose, noapp=opts.noapp)
+                     verbose=opts.verbose, noapp=opts.noapp,
+                     extract_workers=opts.workers, store_dir=opts.store,
+                     compile_workers=opts.compile)
         if opts.remove:
             ei.remove()
         else: # default is always install
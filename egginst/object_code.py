@@ -2,6 +2,7 @@
 
 import sys
 import re
+import mmap
 from os.path import abspath, join, islink, isfile, exists
 
 
@@ -43,8 +44,18 @@ def get_object_type(path):
     return MAGIC.get(head)
 
 
-def find_lib(fn):
-    for tgt in _targets:
+def object_type_from_head(path, head):
+    """
+    Return the object file type of a file, given its path and (at least)
+    the first 4 bytes of its content, e.g. while the file is being written.
+    """
+    if path.endswith(NO_OBJ):
+        return None
+    return MAGIC.get(head[:4])
+
+
+def find_lib(fn, targets=None):
+    for tgt in _targets if targets is None else targets:
         dst = abspath(join(tgt, fn))
         if exists(dst):
             return dst
@@ -112,16 +123,74 @@ def macho_add_rpaths_to_file(filename, rpaths):
             header.write(f)
 
 placehold_pat = re.compile(5 * '/PLACEHOLD' + '([^\0\\s]*)\0')
-def fix_object_code(path):
-    tp = get_object_type(path)
+def find_placeholders(data):
+    """
+    Return the list of matches of placehold_pat in data (a string or an
+    mmap object), in the same way as finditer would, but using find, such
+    that only the locations which start with the placeholder are matched.
+    """
+    res = []
+    start = 5 * '/PLACEHOLD'
+    pos = data.find(start)
+    while pos != -1:
+        m = placehold_pat.match(data, pos)
+        if m:
+            res.append(m)
+            pos = data.find(start, m.end())
+        else:
+            pos = data.find(start, pos + 1)
+    return res
+
+
+def has_placeholders(path):
+    """
+    Return True if the file at path contains a placeholder.
+    """
+    f = open(path, 'rb')
+    try:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (mmap.error, ValueError):
+        # empty file
+        f.close()
+        return False
+    try:
+        return bool(find_placeholders(data))
+    finally:
+        data.close()
+        f.close()
+
+
+def fix_object_code(path, tp=None, targets=None):
+    """
+    Replaces the placeholders in the object file path, whose type tp is
+    determined when not given, by the target directories (which default
+    to _targets).  The file is scanned and patched through a memory
+    mapping, such that it is never read into memory as a whole.
+    """
+    if targets is None:
+        targets = _targets
+    if tp is None:
+        tp = get_object_type(path)
     if tp is None:
         return
-    
+
     f = open(path, 'r+b')
-    data = f.read()
-    matches = list(placehold_pat.finditer(data))
-    if not matches:
+    try:
+        data = mmap.mmap(f.fileno(), 0)
+    except (mmap.error, ValueError):
+        # empty file
+        f.close()
+        return
+    try:
+        _fix_placeholders(path, tp, data, targets)
+    finally:
+        data.close()
         f.close()
+
+
+def _fix_placeholders(path, tp, data, targets):
+    matches = find_placeholders(data)
+    if not matches:
         return
 
     if verbose:
@@ -133,10 +202,10 @@ def fix_object_code(path):
 
         if tp.startswith('MachO-') and rest.startswith('/'):
             # deprecated: because we now use rpath on OSX as well
-            r = find_lib(rest[1:])
+            r = find_lib(rest[1:], targets)
         else:
             assert rest == '' or rest.startswith(':')
-            rpaths = list(_targets)
+            rpaths = list(targets)
             # extend the list with rpath which were already in the binary,
             # if any
             rpaths.extend(p for p in rest.split(':') if p)
@@ -150,9 +219,8 @@ def fix_object_code(path):
             raise Exception("placeholder %r too short" % m.group(0))
         r += padding * '\0'
         assert m.start() + len(r) == m.end()
-        f.seek(m.start())
-        f.write(r)
-    f.close()
+        data[m.start():m.end()] = r
+    data.flush()
 
 
 def fix_files(egg):
@@ -163,16 +231,24 @@ def fix_files(egg):
 
     prefixes = [egg.prefix] if egg.prefix != abspath(sys.prefix) else [sys.prefix]
 
-    _targets = []
+    # eggs may be installed concurrently, so the targets of this egg are
+    # passed on explicitly (_targets is only kept for other callers)
+    targets = []
     for prefix in prefixes:
         for line in egg.lines_from_arcname('EGG-INFO/inst/targets.dat'):
-            _targets.append(join(prefix, line))
-        _targets.append(join(prefix, 'lib'))
+            targets.append(join(prefix, line))
+        targets.append(join(prefix, 'lib'))
+    _targets = targets
 
     if verbose:
         print 'Target directories:'
-        for tgt in _targets:
+        for tgt in targets:
             print '    %r' % tgt
 
+    # the object files are classified while the egg is extracted
+    object_types = getattr(egg, 'object_types', None)
     for p in egg.files:
-        fix_object_code(p)
+        if object_types is None:
+            fix_object_code(p, targets=targets)
+        elif object_types.get(p) and not islink(p):
+            fix_object_code(p, object_types[p], targets)
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+from uuid import uuid4
+from os.path import isdir, join
+
+from utils import on_win, makedirs, rm_rf, is_zipinfo_symlink
+from object_code import get_object_type, has_placeholders
+
+
+def _read_json(path):
+    try:
+        with open(path) as fi:
+            return json.load(fi)
+    except (IOError, ValueError):
+        return None
+
+
+class UnpackedStore(object):
+    """
+    Store of unpacked eggs, which is shared by all prefixes (and package
+    directories) on a machine.  Each egg is extracted once, into the
+    directory <root>/<egg name>, and its regular files are then installed
+    into a prefix by hardlinking them (where the file system allows it),
+    instead of extracting the egg again.  As a hardlink is the same file
+    in all prefixes, the files in the store are read-only, and files which
+    are changed once they are installed, i.e. object files which contain
+    placeholders (see object_code), scripts and the files in the meta data
+    directory (the hooks), are copied.
+
+    Next to each directory, <root>/<egg name>.json stores the size and
+    modification time of the egg which was extracted, such that a changed
+    egg is extracted again, and a dictionary mapping the names of the
+    regular files in the egg to a dictionary with the 'object_type' and
+    whether the file contains 'placeholders'.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _stamp(self, egg_path):
+        st = os.stat(egg_path)
+        return [st.st_size, st.st_mtime]
+
+    def _lookup(self, dir_path, stamp):
+        meta = _read_json(dir_path + '.json')
+        if meta and meta.get('stamp') == stamp and isdir(dir_path):
+            return dir_path, meta['members']
+        return None
+
+    @staticmethod
+    def mode(executable):
+        """
+        return the mode of a file in the store
+        """
+        return 0555 if executable else 0444
+
+    def get(self, archive, fn, executable=lambda arcname: False):
+        """
+        return tuple(directory, members) for the egg with filename fn (given
+        as an Archive object), and extract the egg into the store first,
+        unless it already is in the store, where members is the dictionary
+        described above, and executable(arcname) tells which files are
+        installed as executables (and are therefore executable in the store)
+        """
+        dir_path = join(self.root, fn)
+        stamp = self._stamp(archive.path)
+        res = self._lookup(dir_path, stamp)
+        if res is None:
+            res = self._unpack(archive, dir_path, stamp, executable)
+        return res
+
+    def _unpack(self, archive, dir_path, stamp, executable):
+        # extract into a temporary directory first, such that a directory
+        # in the store is always complete
+        tmp_dir = '%s.tmp-%s' % (dir_path, uuid4().hex)
+        members = {}
+        try:
+            makedirs(tmp_dir)
+            for arcname in archive.names:
+                if (arcname.endswith('/') or
+                        is_zipinfo_symlink(archive.getinfo(arcname))):
+                    continue
+                path = join(tmp_dir, *arcname.split('/'))
+                makedirs(os.path.dirname(path))
+                fi = archive.open(arcname)
+                with open(path, 'wb') as fo:
+                    shutil.copyfileobj(fi, fo, 2 ** 18)
+                fi.close()
+                os.chmod(path, self.mode(executable(arcname)))
+                tp = get_object_type(path)
+                members[arcname] = dict(
+                    object_type=tp,
+                    placeholders=bool(tp) and has_placeholders(path))
+
+            # another process might have extracted the egg in the meantime
+            res = self._lookup(dir_path, stamp)
+            if res is not None:
+                return res
+            rm_rf(dir_path)
+            os.rename(tmp_dir, dir_path)
+        finally:
+            rm_rf(tmp_dir)
+
+        meta_path = dir_path + '.json'
+        with open(meta_path + '.part', 'w') as fo:
+            json.dump(dict(stamp=stamp, members=members), fo)
+        if on_win:
+            rm_rf(meta_path)
+        os.rename(meta_path + '.part', meta_path)
+        return dir_path, members
+
+    @staticmethod
+    def link(src, dst, copy=False):
+        """
+        install the file src (in the store) as dst, by creating a hardlink,
+        unless copy is True, or the file system does not support it (e.g.
+        the store and dst are on different devices), in which case the
+        file is copied (without its mode), and return whether a hardlink
+        was created
+        """
+        if not copy and hasattr(os, 'link'):
+            try:
+                os.link(src, dst)
+                return True
+            except OSError:
+                pass
+        shutil.copyfile(src, dst)
+        return False
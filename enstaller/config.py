@@ -45,6 +45,15 @@ default = dict(
     EPD_userpass=None,
     use_webservice=True,
     autoupdate = True,
+    fetch_workers=4,
+    pipeline=False,
+    extract_workers=1,
+    unpacked_store=None,
+    install_workers=1,
+    compile_workers=0,
+    sharded_index=False,
+    index_deltas=False,
+    solver=False,
     IndexedRepos=[],
 )
 
@@ -130,6 +139,47 @@ IndexedRepos = [
 # Uncomment the next line to turn off automatic prompts to update
 # enstaller.
 #autoupdate = False
+
+# The maximal number of eggs which enpkg downloads at the same time.
+# Set this to 1 to download eggs one after another.
+#fetch_workers = 4
+
+# Uncomment the next line to install eggs while the remaining eggs are
+# still being downloaded (rather than downloading all eggs first).
+#pipeline = True
+
+# The number of threads which extract the files of an egg when installing
+# it.  Using more threads may speed up installing large eggs.
+#extract_workers = 4
+
+# Directory in which each egg is unpacked once, such that installing it
+# (into any prefix) creates hardlinks to the unpacked files instead of
+# extracting the egg again.  This is useful when creating many prefixes.
+#unpacked_store = '/usr/local/share/enpkg-store'
+
+# The maximal number of eggs which enpkg installs at the same time.  Only
+# eggs which do not depend on each other are installed concurrently.
+#install_workers = 4
+
+# The number of processes which byte-compile the Python modules of each
+# egg after installing it.  By default (0), modules which are not compiled
+# in the egg are compiled when they are first imported.
+#compile_workers = 4
+
+# Uncomment the next line to fetch the index of the HTTP repositories
+# listed in IndexedRepos one project at a time (which requires the
+# repositories to provide a sharded index, i.e. a shards.json file).
+#sharded_index = True
+
+# Uncomment the next line to update the cached index of the HTTP
+# repositories listed in IndexedRepos from the index deltas they publish
+# (which requires the repositories to provide a deltas directory).
+#index_deltas = True
+
+# Uncomment the next line to always resolve dependencies using the
+# backtracking solver (by default, it is only used when the simple
+# resolution does not find a consistent set of packages).
+#solver = True
 """
 
 
@@ -436,6 +486,8 @@ def read():
             read.cache[k] = [fill_url(url) for url in v]
         elif k in ('prefix', 'local'):
             read.cache[k] = abs_expanduser(v)
+        elif k == 'unpacked_store' and v:
+            read.cache[k] = abs_expanduser(v)
     return read.cache
 
 
@@ -453,7 +505,10 @@ def print_config(remote, prefix):
     print "config file:", get_path()
     print "settings:"
     print "    prefix = %s" % prefix
-    for k in 'local', 'noapp', 'proxy':
+    for k in ('local', 'noapp', 'proxy', 'fetch_workers', 'pipeline',
+              'extract_workers', 'unpacked_store', 'install_workers',
+              'compile_workers', 'sharded_index', 'index_deltas',
+              'solver'):
         print "    %s = %r" % (k, get(k))
     print "    IndexedRepos:", '(not used)' if get('use_webservice') else ''
     for repo in get('IndexedRepos'):
@@ -1,9 +1,11 @@
 import re
 import os
 import json
-import zipfile
-from os.path import getmtime, isfile, join
+import hashlib
+from collections import defaultdict
+from os.path import getmtime, isdir, isfile, join
 
+from egginst.archive import Archive
 from egginst.eggmeta import info_from_z
 
 from utils import info_file
@@ -22,17 +24,101 @@ def split_eggname(eggname):
     return m.group(1), m.group(2), int(m.group(3))
 
 def info_from_egg(path):
-    z = zipfile.ZipFile(path)
+    z = Archive(path)
     res = info_from_z(z)
     z.close()
     return res
 
-def update_index(dir_path, force=False, verbose=False):
+def shard_name(key):
+    """
+    return the name of the index shard which (usually) contains the given
+    key, i.e. the lowercase project name of an egg or patch filename
+    """
+    return key.split('-')[0].lower()
+
+def write_shards(dir_path, index):
+    """
+    Write the sharded layout of the index, i.e. one index file per project
+    name, 'shards/<name>.json', and the manifest 'shards.json', which maps
+    each name to the MD5 sum of its index file.  An entry whose key does
+    not start with its project name is also written to the shard given by
+    shard_name(key), such that any key can be found in a single shard.
+    Shard files which did not change are not rewritten.
+    """
+    shards_dir = join(dir_path, 'shards')
+    if not isdir(shards_dir):
+        os.mkdir(shards_dir)
+
+    groups = defaultdict(dict)
+    for key, info in index.iteritems():
+        groups[info['name']][key] = info
+        groups[shard_name(key)][key] = info
+
+    manifest = {}
+    for name, shard in groups.iteritems():
+        data = json.dumps(shard, indent=2, sort_keys=True)
+        manifest[name] = hashlib.md5(data).hexdigest()
+        path = join(shards_dir, name + '.json')
+        if isfile(path) and open(path, 'rb').read() == data:
+            continue
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    for fn in os.listdir(shards_dir):
+        if fn.endswith('.json') and fn[:-5] not in manifest:
+            os.unlink(join(shards_dir, fn))
+
+    with open(join(dir_path, 'shards.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def write_deltas(dir_path, old_data, new_data, keep=10):
+    """
+    Write the delta between the old and new index data (the content of
+    the index.json file before and after an update) to the 'deltas'
+    subdirectory.  The delta is named after the MD5 sum of the old index,
+    and contains the 'changed' (or added) entries, the 'removed' keys and
+    the 'md5' sum of the new index.  The new index gets an empty delta,
+    which tells clients that their index is current.  Only the most recent
+    `keep` deltas are kept.
+    """
+    deltas_dir = join(dir_path, 'deltas')
+    if not isdir(deltas_dir):
+        os.mkdir(deltas_dir)
+
+    new_md5 = hashlib.md5(new_data).hexdigest()
+    deltas = {new_md5: dict(md5=new_md5, changed={}, removed=[])}
+    if old_data is not None:
+        old_md5 = hashlib.md5(old_data).hexdigest()
+        if old_md5 != new_md5:
+            old = json.loads(old_data)
+            new = json.loads(new_data)
+            deltas[old_md5] = dict(
+                md5=new_md5,
+                changed=dict((key, info) for key, info in new.iteritems()
+                             if old.get(key) != info),
+                removed=sorted(key for key in old if key not in new))
+
+    for md5, delta in deltas.iteritems():
+        with open(join(deltas_dir, md5 + '.json'), 'w') as f:
+            json.dump(delta, f, indent=2, sort_keys=True)
+
+    old_deltas = sorted((getmtime(join(deltas_dir, fn)), fn)
+                        for fn in os.listdir(deltas_dir)
+                        if fn.endswith('.json') and fn[:-5] not in deltas)
+    for mtime, fn in old_deltas[:max(0, len(old_deltas) - keep + 1)]:
+        os.unlink(join(deltas_dir, fn))
+
+def update_index(dir_path, force=False, verbose=False, shards=True,
+                 deltas=True):
     index_path = join(dir_path, 'index.json')
-    if force or not isfile(index_path):
+    if isfile(index_path):
+        old_data = open(index_path, 'rb').read()
+    else:
+        old_data = None
+    if force or old_data is None:
         index = {}
     else:
-        index = json.load(open(index_path, 'r'))
+        index = json.loads(old_data)
 
     new_index = {}
     for fn in os.listdir(dir_path):
@@ -54,8 +140,14 @@ def update_index(dir_path, force=False, verbose=False):
             info['type'] = 'patch'
         new_index.update(patch_index)
 
+    new_data = json.dumps(new_index, indent=2, sort_keys=True)
     with open(index_path, 'w') as f:
-        json.dump(new_index, f, indent=2, sort_keys=True)
+        f.write(new_data)
+
+    if deltas:
+        write_deltas(dir_path, old_data, new_data)
+    if shards:
+        write_shards(dir_path, new_index)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,12 @@
 import os
 import json
+import glob
 import string
-from os.path import isdir, isfile, join
+from os.path import isfile, join
 from abc import ABCMeta, abstractmethod
 
 import egginst
+from egginst.installdb import InstallDB
 
 from egg_meta import split_eggname
 
@@ -50,8 +52,38 @@ class EggCollection(AbstractEggCollection):
         self.hook = hook
         self.evt_mgr = evt_mgr
         self.verbose = False
+        # the number of threads extracting each egg
+        self.extract_workers = 1
+        # the directory of unpacked eggs, if any
+        self.unpacked_store = None
+        # the number of processes byte-compiling each egg (0 for none)
+        self.compile_workers = 0
 
         self.pkgs_dir = join(self.prefix, 'pkgs')
+        if self.hook:
+            self.db = InstallDB(self.pkgs_dir, 'EGG-INFO')
+        else:
+            self.db = InstallDB(join(self.prefix, 'EGG-INFO'))
+        # maps meta data directories to tuple(stamp of _info.json, info)
+        self._infos = {}
+
+    def _info(self, meta_dir):
+        """
+        return the info (see info_from_metadir) for the given meta data
+        directory, where the parsed _info.json files are cached (as long
+        as their modification time and size do not change)
+        """
+        try:
+            st = os.stat(join(meta_dir, '_info.json'))
+        except OSError:
+            return None
+        stamp = st.st_mtime, st.st_size
+        cached = self._infos.get(meta_dir)
+        if cached is None or cached[0] != stamp:
+            cached = stamp, info_from_metadir(meta_dir)
+            self._infos[meta_dir] = cached
+        # callers may modify the dictionary
+        return dict(cached[1]) if cached[1] else None
 
     def find(self, egg):
         try:
@@ -63,7 +95,7 @@ class EggCollection(AbstractEggCollection):
                         '%s-%s-%d' % (n.lower(), v, b), 'EGG-INFO')
         else:
             path = join(self.prefix, 'EGG-INFO', n.lower())
-        info = info_from_metadir(path)
+        info = self._info(path)
         if info and info['key'] == egg:
             return info
         else:
@@ -71,34 +103,44 @@ class EggCollection(AbstractEggCollection):
 
     def query(self, **kwargs):
         name = kwargs.get('name')
-        if self.hook:
-            if not isdir(self.pkgs_dir):
-                return
-            for fn in sorted(os.listdir(self.pkgs_dir), key=string.lower):
-                if name and not fn.startswith(name + '-'):
-                    continue
-                info = info_from_metadir(join(self.pkgs_dir, fn, 'EGG-INFO'))
-                if info and all(info.get(k) == v
-                                for k, v in kwargs.iteritems()):
-                    yield info['key'], info
-        else:
-            egginfo_dir = join(self.prefix, 'EGG-INFO')
-            if not isdir(egginfo_dir):
-                return
-            for fn in sorted(os.listdir(egginfo_dir), key=string.lower):
-                if name and fn != name:
-                    continue
-                info = info_from_metadir(join(egginfo_dir, fn))
+        if name:
+            # only the meta data directories for the name are looked at
+            if self.hook:
+                meta_dirs = sorted(glob.glob(join(self.pkgs_dir, name + '-*',
+                                                  'EGG-INFO')),
+                                   key=string.lower)
+            else:
+                meta_dirs = [join(self.prefix, 'EGG-INFO', name)]
+            for meta_dir in meta_dirs:
+                info = self._info(meta_dir)
                 if info and all(info.get(k) == v
                                 for k, v in kwargs.iteritems()):
                     yield info['key'], info
+            return
+
+        # the installed packages are looked up in the database, which is
+        # only rebuilt from the _info.json files when it is out of date
+        entries = self.db.entries()
+        for fn in sorted(entries, key=string.lower):
+            info = entries[fn]['info']
+            if info is None:
+                continue
+            info = dict(info)
+            info['installed'] = True
+            info['meta_dir'] = self.db.meta_dir(fn)
+            if all(info.get(k) == v for k, v in kwargs.iteritems()):
+                yield info['key'], info
 
     def install(self, egg, dir_path, extra_info=None):
         ei = egginst.EggInst(join(dir_path, egg),
                              prefix=self.prefix, hook=self.hook,
                              evt_mgr=self.evt_mgr,
-                             pkgs_dir=self.pkgs_dir, verbose=self.verbose)
+                             pkgs_dir=self.pkgs_dir, verbose=self.verbose,
+                             extract_workers=self.extract_workers,
+                             store_dir=self.unpacked_store,
+                             compile_workers=self.compile_workers)
         ei.super_id = getattr(self, 'super_id', None)
+        ei.hooks = getattr(self, 'hooks', None)
         ei.install(extra_info)
 
     def remove(self, egg):
@@ -107,6 +149,7 @@ class EggCollection(AbstractEggCollection):
                              evt_mgr=self.evt_mgr,
                              pkgs_dir=self.pkgs_dir, verbose=self.verbose)
         ei.super_id = getattr(self, 'super_id', None)
+        ei.hooks = getattr(self, 'hooks', None)
         ei.remove()
 
 
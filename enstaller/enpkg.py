@@ -1,27 +1,43 @@
 import sys
+import Queue
+import threading
 import warnings
+from collections import defaultdict
 from uuid import uuid4
 from os.path import isdir, isfile, join
 import os
 
-from store.indexed import LocalIndexedStore, RemoteHTTPIndexedStore
+from store.indexed import (LocalIndexedStore, RemoteHTTPIndexedStore,
+                           ShardedHTTPIndexedStore)
 from store.joined import JoinedStore
 
 from eggcollect import EggCollection, JoinedEggCollection
 
 from resolve import Req, Resolve, comparable_info
-from fetch import FetchAPI
+from fetch import FetchAPI, FetchPool
 from egg_meta import is_valid_eggname, split_eggname
 from history import History
+from egginst.hooks import HookRunner
+from utils import install_levels
 
 
-def create_joined_store(urls):
+def create_joined_store(urls, sharded=False, deltas=False):
+    """
+    create a store joining the repositories given by their urls, HTTP
+    repositories with a sharded index (see egg_meta.write_shards) are used
+    through their shards when sharded is True, and their cached index is
+    updated from the index deltas they publish (see egg_meta.write_deltas)
+    when deltas is True
+    """
     stores = []
     for url in urls:
         if url.startswith('file://'):
             stores.append(LocalIndexedStore(url[7:]))
         elif url.startswith(('http://', 'https://')):
-            stores.append(RemoteHTTPIndexedStore(url))
+            if sharded:
+                stores.append(ShardedHTTPIndexedStore(url, deltas=deltas))
+            else:
+                stores.append(RemoteHTTPIndexedStore(url, deltas=deltas))
         elif isdir(url):
             stores.append(LocalIndexedStore(url))
         else:
@@ -126,9 +142,48 @@ class Enpkg(object):
         emitted to the event manager.  By default, a simple progress bar
         is displayed on the console (which does not use the event manager
         at all).
+
+    fetch_workers: int -- default: 4
+        The maximal number of eggs which are fetched concurrently by
+        the execute method.  Use 1 to fetch eggs one at a time.
+
+    pipeline: boolean -- default: False
+        By default, all eggs are fetched before anything is removed or
+        installed.  When pipeline is set to True, each egg is installed
+        as soon as it (and all eggs before it) has been fetched, while
+        the remaining eggs are still being fetched in the background.
+        A package which is replaced by a fetched egg is only removed right
+        before that egg is installed.
+
+    solver: boolean -- default: False
+        By default, dependencies are resolved greedily (using the largest
+        versions), and the backtracking solver is only used when this
+        does not give a consistent set of eggs.  When solver is set to
+        True, the solver is always used.
+
+    extract_workers: int -- default: 1
+        The number of threads which extract the files of each egg being
+        installed.  By default, the files are extracted one at a time.
+
+    unpacked_store: path -- default: None
+        A directory in which each egg is unpacked once, such that its
+        files are installed into the prefixes by creating hardlinks.
+
+    install_workers: int -- default: 1
+        The maximal number of eggs which are installed concurrently by
+        the execute method.  Eggs are grouped into levels, such that the
+        eggs of one level do not depend on each other, and each level is
+        installed completely before the next one is started.
+
+    compile_workers: int -- default: 0
+        The number of processes which byte-compile the Python modules of
+        each egg after installing it (unless the egg contains the compiled
+        modules).  By default, modules are compiled when first imported.
     """
     def __init__(self, remote=None, userpass='<config>', prefixes=[sys.prefix],
-                 hook=False, evt_mgr=None, verbose=False):
+                 hook=False, evt_mgr=None, verbose=False, fetch_workers=4,
+                 pipeline=False, solver=False, extract_workers=1,
+                 unpacked_store=None, install_workers=1, compile_workers=0):
         self.local_dir = get_writable_local_dir(prefixes[0])
         if remote is None:
             self.remote = RemoteHTTPIndexedStore(get_default_url(),
@@ -146,10 +201,18 @@ class Enpkg(object):
         self.hook = hook
         self.evt_mgr = evt_mgr
         self.verbose = verbose
+        self.fetch_workers = fetch_workers
+        self.pipeline = pipeline
+        self.solver = solver
+        self.install_workers = install_workers
 
         self.ec = JoinedEggCollection([
                 EggCollection(prefix, self.hook, self.evt_mgr)
                 for prefix in self.prefixes])
+        for c in self.ec.collections:
+            c.extract_workers = extract_workers
+            c.unpacked_store = unpacked_store
+            c.compile_workers = compile_workers
         self._connected = False
 
     # ============= methods which relate to remove store =================
@@ -193,6 +256,30 @@ class Enpkg(object):
         except TypeError:
             return info_list
 
+    def info_lists(self):
+        """
+        return a dictionary mapping each project name to the list of
+        metadata dictionaries which info_list_name returns for that name,
+        using a single pass over the remote KVS (rather than one query for
+        each name).  Unlike info_list_name, the metadata also contains
+        the 'key' (egg filename).
+        """
+        # the name is not needed (grouping by name is done below), but the
+        # python version of the egg must match
+        req = Req('')
+        res = defaultdict(list)
+        for key, info in self.query_remote():
+            if req.matches(info):
+                info = dict(info)
+                info['key'] = key
+                res[info['name']].append(info)
+        for info_list in res.itervalues():
+            try:
+                info_list.sort(key=comparable_info)
+            except TypeError:
+                pass
+        return dict(res)
+
     # ============= methods which relate to local installation ===========
 
     def query_installed(self, **kwargs):
@@ -239,8 +326,13 @@ class Enpkg(object):
             from egginst.console import ProgressManager
 
         self.super_id = uuid4()
+        # the hooks of all eggs are run by one helper interpreter, and the
+        # post_egginst.py hooks of each level of eggs are run (in the order
+        # of the eggs) once the level is installed
+        hooks = HookRunner()
         for c in self.ec.collections:
             c.super_id = self.super_id
+            c.hooks = hooks
 
         progress = ProgressManager(
                 self.evt_mgr, source=self,
@@ -251,26 +343,144 @@ class Enpkg(object):
                 progress_type="super", filename=actions[-1][1],
                 disp_amount=len(actions), super_id=None)
 
+        fetches = [(egg, bool(int(opcode[-1])))
+                   for opcode, egg in actions if opcode.startswith('fetch_')]
+        if fetches:
+            self._connect()
+        fetched = set(egg for egg, force in fetches)
+        # maps project names to the fetched eggs which replace them
+        replacing = dict((split_eggname(egg)[0].lower(), egg)
+                         for egg in fetched)
+
         with History(None if self.hook else self.prefixes[0]):
-            with progress:
-                for n, (opcode, egg) in enumerate(actions):
-                    if opcode.startswith('fetch_'):
-                        self.fetch(egg, force=int(opcode[-1]))
-                    elif opcode == 'remove':
-                        self.ec.remove(egg)
-                    elif opcode == 'install':
-                        if self._connected:
-                            extra_info = self.remote.get_metadata(egg)
+            with progress, hooks:
+                with self._fetch_pool() as pool:
+                    # all fetches are started right away, and are waited for
+                    # (in order) when their action comes up, or in pipeline
+                    # mode, when the egg is actually needed
+                    for egg, force in fetches:
+                        pool.submit(egg, force)
+                    n = 0
+                    for opcode, eggs in self._schedule(
+                            actions, replacing if self.pipeline else {}):
+                        if opcode.startswith('fetch_'):
+                            if not self.pipeline:
+                                pool.wait(eggs[0])
+                        elif opcode == 'remove':
+                            name = split_eggname(eggs[0])[0].lower()
+                            if self.pipeline and name in replacing:
+                                pool.wait(replacing[name])
+                            self.ec.remove(eggs[0])
+                        elif opcode == 'install':
+                            for egg in eggs:
+                                if self.pipeline and egg in fetched:
+                                    pool.wait(egg)
+                            try:
+                                self._install_level(eggs)
+                            finally:
+                                hooks.flush(eggs)
                         else:
-                            extra_info = None
-                        self.ec.install(egg, self.local_dir, extra_info)
-                    else:
-                        raise Exception("unknown opcode: %r" % opcode)
-                    progress(step=n)
+                            raise Exception("unknown opcode: %r" % opcode)
+                        progress(step=n)
+                        n += len(eggs)
 
         self.super_id = None
         for c in self.ec.collections:
             c.super_id = self.super_id
+            c.hooks = None
+
+    def _schedule(self, actions, replacing={}):
+        """
+        return a list of tuples(opcode, list of eggs) for executing the
+        actions, where each run of consecutive 'install' actions is split
+        into the levels of eggs which can be installed concurrently (see
+        utils.install_levels), and all other actions have one egg each.
+        The removal of a package whose name is in 'replacing' (which maps
+        project names to eggs) is moved right before the install of the
+        egg replacing it.
+        """
+        res = []
+        run = []
+        # maps eggs to the eggs which are removed before they are installed
+        removes = defaultdict(list)
+        for opcode, egg in list(actions) + [(None, None)]:
+            if opcode == 'install':
+                run.append(egg)
+                continue
+            if opcode == 'remove':
+                name = split_eggname(egg)[0].lower()
+                if name in replacing:
+                    removes[replacing[name]].append(egg)
+                    continue
+            if run:
+                for level in self._install_levels(run):
+                    for new in level:
+                        res.extend(('remove', [old])
+                                   for old in removes.pop(new, []))
+                    res.append(('install', level))
+                run = []
+            if opcode is not None:
+                res.append((opcode, [egg]))
+        # removals whose replacing egg is not installed
+        for new in sorted(removes):
+            res.extend(('remove', [old]) for old in removes[new])
+        return res
+
+    def _install_levels(self, eggs):
+        if (self.install_workers < 2 or not self._connected or
+                not all(self.remote.exists(egg) for egg in eggs)):
+            # without the meta data, the dependencies are unknown
+            return [[egg] for egg in eggs]
+        resolver = Resolve(self.remote)
+        return install_levels(
+            eggs, resolver.name_egg,
+            lambda egg: [r.name for r in resolver.reqs_egg(egg)])
+
+    def _install_level(self, eggs):
+        """
+        install the eggs (which do not depend on each other) concurrently,
+        using up to install_workers threads, and raise the first error (in
+        the order of the eggs) once all installs are done
+        """
+        items = []
+        for egg in eggs:
+            if self._connected:
+                extra_info = self.remote.get_metadata(egg)
+            else:
+                extra_info = None
+            items.append((egg, extra_info))
+        if len(items) == 1:
+            self.ec.install(items[0][0], self.local_dir, items[0][1])
+            return
+
+        todo = Queue.Queue()
+        for item in items:
+            todo.put(item)
+        # maps eggs to the exc_info of their failed install
+        errors = {}
+
+        def worker():
+            while True:
+                try:
+                    egg, extra_info = todo.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    self.ec.install(egg, self.local_dir, extra_info)
+                except Exception:
+                    errors[egg] = sys.exc_info()
+
+        threads = [threading.Thread(target=worker)
+                   for i in xrange(min(self.install_workers, len(items)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        for egg in eggs:
+            if egg in errors:
+                exc_info = errors[egg]
+                raise exc_info[0], exc_info[1], exc_info[2]
 
     def install_actions(self, arg, mode='recur', force=False, forceall=False):
         """
@@ -282,20 +492,34 @@ class Enpkg(object):
           * a requirement object (enstaller.resolve.Req)
           * the requirement as a string
         """
-        req = req_from_anything(arg)
+        return self.install_actions_batch([arg], mode, force, forceall)
+
+    def install_actions_batch(self, args, mode='recur', force=False,
+                              forceall=False):
+        """
+        Create one list of actions which are required for installing (or
+        updating) several packages together, such that shared dependencies
+        are resolved, fetched and installed only once.  Each element of
+        'args' may be any of the arguments listed in install_actions.
+        """
+        reqs = [req_from_anything(arg) for arg in args]
         # resolve the list of eggs that need to be installed
         self._connect()
-        eggs = Resolve(self.remote, self.verbose).install_sequence(req, mode)
-        if eggs is None:
-             raise EnpkgError("No egg found for requirement '%s'." % req)
+        resolver = Resolve(self.remote, self.verbose, self.solver)
+        for req in reqs:
+            if resolver.get_egg(req) is None:
+                err = EnpkgError("No egg found for requirement '%s'." % req)
+                err.req = req
+                raise err
+        eggs = resolver.install_sequence_batch(reqs, mode)
 
         if not forceall:
-            # remove already installed eggs from egg list
-            rm = lambda eggs: [e for e in eggs if self.find(e) is None]
-            if force:
-                eggs = rm(eggs[:-1]) + [eggs[-1]]
-            else:
-                eggs = rm(eggs)
+            # remove already installed eggs from egg list, except for the
+            # eggs of the requirements themselves (as chosen when resolving,
+            # which need not be the best egg of each), when forced
+            names = set(req.name for req in reqs) if force else ()
+            eggs = [e for e in eggs if self.find(e) is None or
+                    split_eggname(e)[0].lower() in names]
 
         res = []
         for egg in eggs:
@@ -401,6 +625,12 @@ class Enpkg(object):
                 index[key] = info
         return index.iteritems()
 
+    def _fetch_pool(self):
+        return FetchPool(self.remote, self.local_dir, self.evt_mgr,
+                         max_workers=self.fetch_workers,
+                         super_id=getattr(self, 'super_id', None),
+                         verbose=self.verbose)
+
     def fetch(self, egg, force=False):
         self._connect()
         f = FetchAPI(self.remote, self.local_dir, self.evt_mgr)
@@ -2,8 +2,10 @@ import math
 import os
 import sys
 import hashlib
+import threading
+import Queue
 from uuid import uuid4
-from os.path import basename, isdir, isfile, join
+from os.path import basename, getsize, isdir, isfile, join
 
 from egginst.utils import human_bytes, rm_rf
 from utils import md5_file
@@ -22,11 +24,24 @@ class FetchAPI(object):
 
     def fetch(self, key):
         path = self.path(key)
-        fi, info = self.remote.get(key)
+        info = self.remote.get_metadata(key)
 
         size = info['size']
         md5 = info.get('md5')
 
+        # resume from an existing (incomplete) .part file, when the store
+        # allows us to skip the data we already have
+        pp = path + '.part'
+        n = getsize(pp) if isfile(pp) else 0
+        fi = None
+        if 0 < n < size:
+            try:
+                fi, n = self.remote.get_partial_data(key, n)
+            except KeyError:
+                pass
+        if fi is None:
+            fi, n = self.remote.get_data(key), 0
+
         if self.evt_mgr:
             from encore.events.api import ProgressManager
         else:
@@ -42,18 +57,25 @@ class FetchAPI(object):
                 disp_amount=human_bytes(size),
                 super_id=getattr(self, 'super_id', None))
 
-        n = 0
         h = hashlib.new('md5')
         if size < 256:
             buffsize = 1
         else:
             buffsize = 2 ** int(math.log(size / 256.0) / math.log(2.0) + 1)
 
-        pp = path + '.part'
-        if sys.platform == 'win32':
+        if n:
+            if self.verbose:
+                print "Resuming %r at %d bytes" % (pp, n)
+            if md5:
+                with open(pp, 'rb') as fo:
+                    while fo.tell() < n:
+                        h.update(fo.read(min(buffsize, n - fo.tell())))
+        elif sys.platform == 'win32':
             rm_rf(pp)
         with progress:
-            with open(pp, 'wb') as fo:
+            with open(pp, 'r+b' if n else 'wb') as fo:
+                fo.seek(n)
+                fo.truncate()
                 while True:
                     chunk = fi.read(buffsize)
                     if not chunk:
@@ -63,10 +85,12 @@ class FetchAPI(object):
                         h.update(chunk)
                     n += len(chunk)
                     progress(step=n)
-        fi.close()
+            fi.close()
 
-        if md5 and h.hexdigest() != md5:
-            raise ValueError("received data MD5 sums mismatch")
+            if md5 and h.hexdigest() != md5:
+                # don't resume from corrupted data next time
+                rm_rf(pp)
+                raise ValueError("received data MD5 sums mismatch")
 
         if sys.platform == 'win32':
             rm_rf(path)
@@ -137,6 +161,112 @@ class FetchAPI(object):
         self.fetch(egg)
 
 
+class FetchPool(object):
+    """
+    Fetch several eggs concurrently, using a bounded pool of worker
+    threads.  Each worker uses its own FetchAPI instance (which reports
+    progress under `super_id`), and eggs are handed back to the caller
+    through the `wait` method in whichever order the caller needs them.
+
+    As soon as one fetch fails, no further fetches are started, and the
+    error is raised (in the caller's thread) by the next call to `wait`.
+    The pool is meant to be used as a context manager:
+
+    with FetchPool(remote, local_dir, max_workers=4) as pool:
+        for egg in eggs:
+            pool.submit(egg)
+        for egg in eggs:
+            pool.wait(egg)
+    """
+    def __init__(self, remote, local_dir, evt_mgr=None, max_workers=4,
+                 super_id=None, verbose=False):
+        self.remote = remote
+        self.local_dir = local_dir
+        self.evt_mgr = evt_mgr
+        self.max_workers = max(1, int(max_workers))
+        self.super_id = super_id
+        self.verbose = verbose
+
+        self._queue = Queue.Queue()
+        self._cond = threading.Condition()
+        # maps egg -> None (pending), True (done) or exc_info (failed)
+        self._status = {}
+        self._error = None
+        self._aborted = False
+        self._threads = []
+
+    def __enter__(self):
+        if not isdir(self.local_dir):
+            os.makedirs(self.local_dir)
+        for i in xrange(self.max_workers):
+            t = threading.Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def submit(self, egg, force=False):
+        with self._cond:
+            self._status[egg] = None
+        self._queue.put((egg, force))
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            egg, force = item
+            with self._cond:
+                aborted = self._aborted
+            if aborted:
+                res = False
+            else:
+                try:
+                    f = FetchAPI(self.remote, self.local_dir, self.evt_mgr)
+                    f.super_id = self.super_id
+                    f.verbose = self.verbose
+                    f.fetch_egg(egg, force)
+                    res = True
+                except Exception:
+                    res = sys.exc_info()
+            with self._cond:
+                self._status[egg] = res
+                if res not in (True, False) and self._error is None:
+                    self._error = res
+                    self._aborted = True
+                self._cond.notify_all()
+
+    def wait(self, egg):
+        """
+        Block until the given (previously submitted) egg is fetched.
+        Raises the first error which occurred in any worker.
+        """
+        with self._cond:
+            while self._error is None and self._status[egg] is None:
+                # a timeout keeps the main thread responsive to Ctrl-C
+                self._cond.wait(0.5)
+            if self._error is not None:
+                exc_type, exc_value, tb = self._error
+                raise exc_type, exc_value, tb
+
+    def shutdown(self):
+        """
+        Stop all workers, pending fetches which have not been started
+        are dropped.
+        """
+        with self._cond:
+            self._aborted = True
+        for t in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            while t.is_alive():
+                t.join(0.5)
+        self._threads = []
+
+
 def main():
     from optparse import OptionParser
     import store.indexed as indexed
@@ -9,7 +9,7 @@ from egginst.utils import human_bytes
 
 from enstaller.store.indexed import LocalIndexedStore, RemoteHTTPIndexedStore
 
-from enstaller.utils import comparable_version, md5_file
+from enstaller.utils import comparable_version, install_order, md5_file
 import metadata
 import dist_naming
 from requirement import Req, add_Reqs_to_spec
@@ -210,35 +210,9 @@ class Chain(object):
         # make sure each project name is listed only once
         assert len(dists) == len(set(self.cname_dist(d) for d in dists))
 
-        # the distributions corresponding to the requirements must be sorted
-        # because the output of this function is otherwise not deterministic
-        dists.sort(key=self.cname_dist)
-
-        # maps dist -> set of required (project) names
-        rns = {}
-        for dist in dists:
-            rns[dist] = set(r.name for r in self.reqs_dist(dist))
-
-        # as long as we have things missing, simply look for things which
-        # can be added, i.e. all the requirements have been added already
-        result = []
-        names_inst = set()
-        while len(result) < len(dists):
-            n = len(result)
-            for dist in dists:
-                if dist in result:
-                    continue
-                # see if all required packages were added already
-                if all(bool(name in names_inst) for name in rns[dist]):
-                    result.append(dist)
-                    names_inst.add(self.index[dist]['cname'])
-                    assert len(names_inst) == len(result)
-
-            if len(result) == n:
-                # nothing was added
-                raise Exception("Loop in dependency graph\n%r" %
-                                [dist_naming.filename_dist(d) for d in dists])
-        return result
+        return install_order(
+            dists, self.cname_dist,
+            lambda dist: [r.name for r in self.reqs_dist(dist)])
 
 
     def _sequence_flat(self, root):
@@ -131,15 +131,17 @@ def imports_option(enpkg, pat=None):
     print FMT % ('Name', 'Version', 'Location')
     print 60 * "="
 
-    names = set(info['name'] for _, info in enpkg.query_installed())
-    for name in sorted(names, key=string.lower):
+    # maps names to tuple(info, location), where the collections of
+    # higher precedence overwrite the ones of lower precedence
+    installed = {}
+    for c in reversed(enpkg.ec.collections):
+        loc = 'sys' if c.prefix == sys.prefix else 'user'
+        for key, info in c.query():
+            installed[info['name']] = info, loc
+    for name in sorted(installed, key=string.lower):
         if pat and not pat.search(name):
             continue
-        for c in reversed(enpkg.ec.collections):
-            index = dict(c.query(name=name))
-            if index:
-                info = index.values()[0]
-                loc = 'sys' if c.prefix == sys.prefix else 'user'
+        info, loc = installed[name]
         print FMT % (name, VB_FMT % info, loc)
 
 
@@ -154,20 +156,19 @@ def search(enpkg, pat=None):
     print FMT4 % ('Name', '  Versions', 'Product', 'Note')
     print 80 * '='
 
-    names = {}
-    for key, info in enpkg.query_remote():
-        names[info['name']] = name_egg(key)
+    info_lists = enpkg.info_lists()
 
     installed = {}
     for key, info in enpkg.query_installed():
         installed[info['name']] = VB_FMT % info
 
-    for name in sorted(names, key=string.lower):
+    for name in sorted(info_lists, key=string.lower):
         if pat and not pat.search(name):
             continue
-        disp_name = names[name]
+        info_list = info_lists[name]
+        disp_name = name_egg(info_list[-1]['key'])
         installed_version = installed.get(name)
-        for info in enpkg.info_list_name(name):
+        for info in info_list:
             version = VB_FMT % info
             disp_ver = (('* ' if installed_version == version else '  ') +
                         version)
@@ -194,9 +195,10 @@ def search(enpkg, pat=None):
 def updates_check(enpkg):
     updates = []
     EPD_update = []
+    info_lists = enpkg.info_lists()
     for key, info in enpkg.query_installed():
-        av_infos = enpkg.info_list_name(info['name'])
-        if len(av_infos) == 0:
+        av_infos = info_lists.get(info['name'])
+        if not av_infos:
             continue
         av_info = av_infos[-1]
         if comparable_info(av_info) > comparable_info(info):
@@ -243,8 +245,8 @@ def update_all(enpkg, args):
                 print FMT % (name_egg(update['current']['key']),
                              VB_FMT % update['current'],
                              VB_FMT % update['update'])
-            for update in updates:
-                install_req(enpkg, update['current']['name'], args)
+            install_reqs(enpkg, [update['current']['name']
+                                 for update in updates], args)
 
 def epd_install_confirm():
     print "Warning: 'enpkg epd' will downgrade any packages that are currently"
@@ -279,6 +281,14 @@ def install_req(enpkg, req, opts):
     If 'use_webservice', check the user's credentials and prompt the
     user to input them if not authenticated.
     """
+    install_reqs(enpkg, [req], opts)
+
+
+def install_reqs(enpkg, reqs, opts):
+    """
+    Like install_req, but resolves and installs several requirements
+    together, in one transaction.
+    """
     # Below is a slightly complicated state machine that attempts to "do
     # the right thing" if the install initially fails.  Basically, the
     # flow is to try the install, prompt the user for credentials if "No
@@ -288,7 +298,7 @@ def install_req(enpkg, req, opts):
     # Unix exit-status codes
     FAILURE = 1
     SUCCESS = 0
-    req = req_from_anything(req)
+    reqs = [req_from_anything(req) for req in reqs]
 
     def _perform_install(last_try=False):
         """
@@ -299,17 +309,28 @@ def install_req(enpkg, req, opts):
         """
         try:
             mode = 'root' if opts.no_deps else 'recur'
-            actions = enpkg.install_actions(
-                    req,
+            actions = enpkg.install_actions_batch(
+                    reqs,
                     mode=mode,
                     force=opts.force, forceall=opts.forceall)
             enpkg.execute(actions)
-            if len(actions) == 0:
-                print "No update necessary, %r is up-to-date." % req.name
-                print_install_time(enpkg, req.name)
+            installed = set(split_eggname(egg)[0].lower()
+                            for opcode, egg in actions if opcode == 'install')
+            for req in reqs:
+                if req.name not in installed:
+                    print "No update necessary, %r is up-to-date." % req.name
+                    print_install_time(enpkg, req.name)
         except EnpkgError, e:
-            if mode == 'root' or e.req is None or e.req == req:
+            if e.req is None and len(reqs) > 1:
+                # the error concerns the requirements together, e.g. no
+                # consistent set of eggs was found for them
+                print e.message
+                print "Requested packages: %s" % ', '.join(r.name
+                                                           for r in reqs)
+                _done(FAILURE)
+            elif mode == 'root' or e.req is None or e.req in reqs:
                 # trying to install just one requirement - try to give more info
+                req = reqs[0] if e.req is None else e.req
                 info_list = enpkg.info_list_name(req.name)
                 if info_list:
                     print "Versions for package %r are:\n%s" % (req.name,
@@ -572,10 +593,18 @@ def main():
         remote = None # Enpkg will create the default
     else:
         urls = [fill_url(u) for u in config.get('IndexedRepos')]
-        remote = create_joined_store(urls)
+        remote = create_joined_store(urls, config.get('sharded_index'),
+                                     config.get('index_deltas'))
 
     enpkg = Enpkg(remote, prefixes=prefixes, hook=args.hook,
-                  evt_mgr=evt_mgr, verbose=args.verbose)
+                  evt_mgr=evt_mgr, verbose=args.verbose,
+                  fetch_workers=config.get('fetch_workers', 4),
+                  pipeline=config.get('pipeline', False),
+                  extract_workers=config.get('extract_workers', 1),
+                  unpacked_store=config.get('unpacked_store'),
+                  install_workers=config.get('install_workers', 1),
+                  compile_workers=config.get('compile_workers', 0),
+                  solver=config.get('solver', False))
 
     if args.config:                               # --config
         config.print_config(enpkg.remote, prefixes[0])
@@ -688,14 +717,14 @@ def main():
         elif not epd_install_confirm():
             return
 
-    for req in reqs:
-        if args.remove:                               # --remove
+    if args.remove:                                   # --remove
+        for req in reqs:
             try:
                 enpkg.execute(enpkg.remove_actions(req))
             except EnpkgError as e:
                 print e.message
-        else:
-            install_req(enpkg, req, args)             # install (default)
+    else:
+        install_reqs(enpkg, reqs, args)               # install (default)
 
 
 if __name__ == '__main__':
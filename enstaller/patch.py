@@ -4,7 +4,7 @@ import json
 import string
 from os.path import abspath, getsize, getmtime, isdir, isfile, join
 
-from utils import comparable_version, info_file
+from utils import info_file, version_key
 from egg_meta import is_valid_eggname, split_eggname
 try:
     import zdiff
@@ -34,7 +34,7 @@ def update_patches(eggs_dir, patches_dir, verbose=False):
                 if n != name:
                     continue
                 versions.append((v, b))
-            versions.sort(key=(lambda vb: (comparable_version(vb[0]), vb[1])))
+            versions.sort(key=(lambda vb: (version_key(vb[0]), vb[1])))
             versions = ['%s-%d' % vb for vb in versions]
             lv = len(versions)
             #print name, lv, versions
@@ -1,16 +1,21 @@
 import re
 from collections import defaultdict
 
-from utils import PY_VER, comparable_version
+from utils import PY_VER, install_order, version_key
 
 
 
 def comparable_info(spec):
     """
-    Returns a tuple(version, build) for a distribution, version is a
-    RationalVersion object.  The result may be used for as a sort key.
+    Returns a tuple(version, build) for a distribution, version is the
+    tuple returned by version_key.  The result may be used for as a sort
+    key.  The stores compute it once for each index entry ('sort_key').
     """
-    return comparable_version(spec['version']), spec['build']
+    key = spec.get('sort_key')
+    # (the key becomes a list when stored as JSON, e.g. in installed eggs)
+    if type(key) is tuple:
+        return key
+    return version_key(spec['version']), spec['build']
 
 
 class Req(object):
@@ -104,32 +109,78 @@ class Resolve(object):
     class (which is inexpensive), to call the install_sequence method, e.g.:
 
     eggs = Resolve(store).install_sequence(req)
+
+    The recursive resolution is greedy, i.e. it picks the egg with the
+    largest version for each requirement.  When the resulting eggs do not
+    satisfy each others requirements, or when 'solver' is True, a
+    backtracking solver (see enstaller.solver) is used instead.
     """
-    def __init__(self, repo, verbose=False):
+    def __init__(self, repo, verbose=False, solver=False):
         self.repo = repo
         self.verbose = verbose
+        self.solver = solver
+        # maps names to tuple(list of (key, info) of the eggs of that name,
+        # whether the list is sorted by descending version and build)
+        self._candidates = {}
+        # maps requirements to the best matching egg
+        self._best = {}
+        # maps eggs to the set of their requirements
+        self._reqs = {}
+
+    def candidates(self, name):
+        """
+        return the list of tuples(key, info) of all eggs with the given
+        name, sorted by descending version and build number (if possible)
+        """
+        try:
+            return self._candidates[name][0]
+        except KeyError:
+            pass
+        items = dict(self.repo.query(type='egg', name=name)).items()
+        try:
+            # a stable sort, so that for equal versions the first egg
+            # wins, just like max() would pick it
+            items.sort(key=lambda item: comparable_info(item[1]),
+                       reverse=True)
+            is_sorted = True
+        except TypeError:
+            # versions which cannot be compared with each other
+            is_sorted = False
+        self._candidates[name] = items, is_sorted
+        return items
 
     def get_egg(self, req):
         """
         return the egg with the largest version and build number
         """
         assert req.strictness >= 1
-        d = dict(self.repo.query(type='egg', name=req.name))
-        if not d:
-            return None
-        matches = []
-        for key, info in d.iteritems():
-            if req.matches(info) and info.get('available', True):
-                matches.append(key)
+        try:
+            return self._best[req]
+        except KeyError:
+            pass
+        items = self.candidates(req.name)
+        matches = [(key, info) for key, info in items
+                   if req.matches(info) and info.get('available', True)]
         if not matches:
-            return None
-        return max(matches, key=lambda k: comparable_info(d[k]))
+            res = None
+        elif self._candidates[req.name][1]:
+            res = matches[0][0]
+        else:
+            res = max(matches, key=lambda item: comparable_info(item[1]))[0]
+        self._best[req] = res
+        return res
 
     def reqs_egg(self, egg):
         """
         return the set of requirement objects listed by the given egg
         """
-        return set(Req(s) for s in self.repo.get_metadata(egg)['packages'])
+        try:
+            return self._reqs[egg]
+        except KeyError:
+            pass
+        res = set(Req(s) for s in self.repo.get_metadata(egg)['packages'])
+        self._reqs[egg] = res
+        return res
 
     def name_egg(self, egg):
         """
@@ -161,34 +212,9 @@ class Resolve(object):
         # make sure each project name is listed only once
         assert len(eggs) == len(set(self.name_egg(d) for d in eggs))
 
-        # the eggs corresponding to the requirements must be sorted
-        # because the output of this function is otherwise not deterministic
-        eggs.sort(key=self.name_egg)
-
-        # maps egg -> set of required (project) names
-        rns = {}
-        for egg in eggs:
-            rns[egg] = set(r.name for r in self.reqs_egg(egg))
-
-        # as long as we have things missing, simply look for things which
-        # can be added, i.e. all the requirements have been added already
-        result = []
-        names_inst = set()
-        while len(result) < len(eggs):
-            n = len(result)
-            for egg in eggs:
-                if egg in result:
-                    continue
-                # see if all required packages were added already
-                if all(bool(name in names_inst) for name in rns[egg]):
-                    result.append(egg)
-                    names_inst.add(self.name_egg(egg))
-                    assert len(names_inst) == len(result)
-
-            if len(result) == n:
-                # nothing was added
-                raise Exception("Loop in dependency graph\n%r" % eggs)
-        return result
+        return install_order(
+            eggs, self.name_egg,
+            lambda egg: [r.name for r in self.reqs_egg(egg)])
 
     def _sequence_flat(self, root):
         eggs = [root]
@@ -208,11 +234,57 @@ class Resolve(object):
             eggs = self.determine_install_order(eggs)
         return eggs
 
-    def _sequence_recur(self, root):
+    def is_consistent(self, eggs, reqs=()):
+        """
+        return True if the 'eggs' satisfy the requirements 'reqs', and the
+        requirements of each egg (not only by name)
+        """
+        index = dict((self.name_egg(d), self.repo.get_metadata(d))
+                     for d in eggs)
+        for r in set(reqs).union(*[self.reqs_egg(d) for d in eggs]):
+            if r.name not in index or not r.matches(index[r.name]):
+                return False
+        return True
+
+    def _sequence_solve(self, root_reqs):
+        from enstaller.solver import Solver
+
+        eggs = Solver(self).solve(root_reqs)
+        if eggs is None:
+            return None
+        return self.determine_install_order(eggs)
+
+    def _sequence_recur(self, roots, root_reqs):
+        if self.solver:
+            eggs = self._sequence_solve(root_reqs)
+            if eggs is None:
+                from enstaller.enpkg import EnpkgError
+                raise EnpkgError('Error: could not find a consistent set of '
+                                 'eggs for: %s' % ', '.join(
+                        str(r) for r in root_reqs))
+            return eggs
+
+        eggs = self._sequence_greedy(roots, root_reqs)
+        if not self.is_consistent(eggs, root_reqs):
+            if self.verbose:
+                print "Inconsistent install sequence, trying solver"
+            solved = self._sequence_solve(root_reqs)
+            if solved is not None:
+                return solved
+        return eggs
+
+    def _sequence_greedy(self, roots, root_reqs):
         reqs_shallow = {}
-        for r in self.reqs_egg(root):
+        for r in root_reqs:
             reqs_shallow[r.name] = r
+        for root in roots:
+            for r in self.reqs_egg(root):
+                if (r.name not in reqs_shallow or
+                        r.strictness > reqs_shallow[r.name].strictness):
+                    reqs_shallow[r.name] = r
         reqs_deep = defaultdict(set)
+        for r in root_reqs:
+            reqs_deep[r.name].add(r)
 
         def add_dependents(egg):
             for r in self.reqs_egg(egg):
@@ -227,11 +299,14 @@ class Resolve(object):
                                      'required by "%s"') % (str(r), egg))
                     err.req = r
                     raise err
-                eggs.add(d)
-                add_dependents(d)
+                # the requirements of each egg only need to be added once
+                if d not in eggs:
+                    eggs.add(d)
+                    add_dependents(d)
 
-        eggs = set([root])
-        add_dependents(root)
+        eggs = set(roots)
+        for root in roots:
+            add_dependents(root)
 
         names = set(self.name_egg(d) for d in eggs)
         if len(eggs) != len(names):
@@ -244,7 +319,9 @@ class Resolve(object):
                     print 'multiple: %s' % name
                     for d in ds:
                         print '    %s' % d
-                r = max(reqs_deep[name], key=lambda r: r.strictness)
+                # for equally strict requirements, the requested ones win
+                r = max(reqs_deep[name],
+                        key=lambda r: (r.strictness, r in root_reqs))
                 assert r.name == name
                 # remove the eggs with name
                 eggs = [d for d in eggs if self.name_egg(d) != name]
@@ -277,5 +354,44 @@ class Resolve(object):
         if mode == 'flat':
             return self._sequence_flat(root)
         if mode == 'recur':
-            return self._sequence_recur(root)
+            return self._sequence_recur([root], [req])
         raise Exception('did not expect: mode = %r' % mode)
+
+    def install_sequence_batch(self, reqs, mode='recur'):
+        """
+        Return the list of eggs which need to be installed for all the
+        requirements 'reqs' together (and None if any of the requirements
+        can not be resolved), such that each project name is listed only
+        once.  The 'mode' may be (see also install_sequence):
+
+        'root':  only the eggs for the requirements themselves
+
+        'flat':  the eggs for the requirements, together with their
+                 direct dependencies
+
+        'recur': dependencies are handled recursively (default), and
+                 when different eggs of the same project are required,
+                 the most strict requirement (preferably one of 'reqs')
+                 determines the egg
+        """
+        if self.verbose:
+            print "Determining install sequence for %r" % list(reqs)
+        roots = [self.get_egg(req) for req in reqs]
+        if None in roots:
+            return None
+        if mode == 'recur':
+            return self._sequence_recur(roots, reqs)
+        if mode not in ('root', 'flat'):
+            raise Exception('did not expect: mode = %r' % mode)
+
+        # the sequences are merged, such that eggs for later requirements
+        # replace the ones (with the same name) for earlier requirements,
+        # as they would when installing the requirements one by one
+        eggs = []
+        for root in roots:
+            seq = [root] if mode == 'root' else self._sequence_flat(root)
+            names = set(self.name_egg(d) for d in seq)
+            eggs = [d for d in eggs if self.name_egg(d) not in names] + seq
+        if self.are_complete(eggs):
+            eggs = self.determine_install_order(eggs)
+        return eggs
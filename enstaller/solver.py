@@ -0,0 +1,157 @@
+"""
+A backtracking dependency solver, which is used by Resolve when the greedy
+recursive resolution does not find a consistent set of eggs (or when it is
+asked to).
+
+The variables are project names, and their values are eggs.  A name becomes
+a variable as soon as it is required, either by one of the requirements
+given to the solver, or by an egg which is assigned to another name.  The
+search assigns names in order of the fewest remaining candidates, each time
+trying the eggs with the largest version and build number first.  Names
+with only one remaining candidate are assigned right away (unit
+propagation).  When a name has no candidates left, the decisions which lead
+to the conflict are determined, recorded as a nogood (learned conflict),
+which prunes all other branches containing the same decisions, and the
+search jumps back to the most recent of these decisions.
+"""
+
+
+class Solver(object):
+
+    def __init__(self, resolve):
+        self.resolve = resolve
+        self.repo = resolve.repo
+        # learned conflicts, each a frozenset of tuples(name, egg), which
+        # can not be assigned together
+        self.nogoods = []
+
+    def solve(self, reqs):
+        """
+        return a list of eggs (in no particular order) which satisfies all
+        requirements 'reqs' and all requirements of the eggs themselves,
+        or None if no such list exists
+        """
+        constraints = {}
+        for r in reqs:
+            constraints.setdefault(r.name, []).append((r, None))
+        ok, res = self._search({}, {}, constraints)
+        if ok:
+            return res.values()
+        return None
+
+    def _info(self, egg):
+        return self.repo.get_metadata(egg)
+
+    def _domain(self, name, assign, constraints):
+        """
+        return tuple(list of the eggs which may be assigned to name,
+        set of assignments which caused the other eggs to be excluded)
+        """
+        reason = set((self.resolve.name_egg(src), src)
+                     for r, src in constraints[name] if src is not None)
+        eggs = []
+        for egg, info in self.resolve.candidates(name):
+            if not info.get('available', True):
+                continue
+            if not all(r.matches(info) for r, src in constraints[name]):
+                continue
+            excluded = False
+            for nogood in self.nogoods:
+                if (name, egg) not in nogood:
+                    continue
+                others = nogood - set([(name, egg)])
+                if all(assign.get(n) == e for n, e in others):
+                    reason |= others
+                    excluded = True
+                    break
+            if not excluded:
+                eggs.append(egg)
+        return eggs, reason
+
+    def _assign(self, name, egg, assign, constraints):
+        assign[name] = egg
+        for r in self.resolve.reqs_egg(egg):
+            constraints.setdefault(r.name, []).append((r, egg))
+
+    def _propagate(self, assign, reasons, constraints):
+        """
+        assign all names which have only one candidate left, until there
+        are none, and return None, or return the set of assignments which
+        is in conflict
+        """
+        changed = True
+        while changed:
+            changed = False
+            for name in sorted(constraints):
+                if name in assign:
+                    egg = assign[name]
+                    info = self._info(egg)
+                    for r, src in constraints[name]:
+                        if not r.matches(info):
+                            conflict = set([(name, egg)])
+                            if src is not None:
+                                conflict.add((self.resolve.name_egg(src), src))
+                            return conflict
+                    continue
+                eggs, reason = self._domain(name, assign, constraints)
+                if len(eggs) == 0:
+                    return reason
+                if len(eggs) == 1:
+                    self._assign(name, eggs[0], assign, constraints)
+                    reasons[name] = reason
+                    changed = True
+        return None
+
+    def _explain(self, conflict, reasons):
+        """
+        replace the assignments in conflict, which were made by propagation,
+        by the assignments which caused them, such that only decisions
+        remain
+        """
+        conflict = set(conflict)
+        while True:
+            implied = [(n, e) for n, e in conflict if reasons.get(n) is not None]
+            if not implied:
+                return frozenset(conflict)
+            for n, e in implied:
+                conflict.discard((n, e))
+                conflict |= reasons[n]
+
+    def _search(self, assign, reasons, constraints):
+        """
+        return tuple(True, assignment) when a solution was found, or
+        tuple(False, set of decisions which are in conflict)
+        """
+        conflict = self._propagate(assign, reasons, constraints)
+        if conflict is not None:
+            conflict = self._explain(conflict, reasons)
+            self.nogoods.append(conflict)
+            return False, conflict
+
+        unassigned = []
+        for name in sorted(constraints):
+            if name not in assign:
+                eggs, reason = self._domain(name, assign, constraints)
+                unassigned.append((len(eggs), name, eggs, reason))
+        if not unassigned:
+            return True, assign
+        n, name, eggs, reason = min(unassigned)
+
+        collected = set()
+        for egg in eggs:
+            assign2 = dict(assign)
+            reasons2 = dict(reasons)
+            reasons2[name] = None
+            constraints2 = dict((k, list(v)) for k, v in constraints.iteritems())
+            self._assign(name, egg, assign2, constraints2)
+            ok, res = self._search(assign2, reasons2, constraints2)
+            if ok:
+                return True, res
+            if (name, egg) not in res:
+                # this decision is not part of the conflict, so trying
+                # the other eggs for this name can not help (backjump)
+                return False, res
+            collected |= res - set([(name, egg)])
+        collected = self._explain(collected | reason, reasons)
+        self.nogoods.append(collected)
+        return False, collected
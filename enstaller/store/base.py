@@ -26,6 +26,14 @@ class AbstractStore(object):
     def get_data(self, key):
         raise NotImplementedError
 
+    def get_partial_data(self, key, offset):
+        """
+        return a tuple(file object, position), where the file object
+        provides the data of key starting at position, which is either
+        the requested offset, or 0 when the store cannot skip data
+        """
+        return self.get_data(key), 0
+
     @abstractmethod
     def get_metadata(self, key, select=None):
         raise NotImplementedError
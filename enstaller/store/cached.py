@@ -1,5 +1,6 @@
 from hashlib import md5
 import json
+import marshal
 import os.path
 import re
 import urllib2
@@ -14,6 +15,8 @@ class CachedHandler(urllib2.BaseHandler):
             cache_dir, 'index_cache', 'metadata.json')
         self._index_path = os.path.join(
             cache_dir, 'index_cache', 'index.json')
+        self._digest_path = os.path.join(
+            cache_dir, 'index_cache', 'index.marshal')
 
     def read_metadata(self):
         try:
@@ -23,12 +26,31 @@ class CachedHandler(urllib2.BaseHandler):
 
         return metadata
 
-    def cache_is_valid(self, metadata=None):
+    def _index_stat(self):
+        """
+        return the (size, mtime, inode) of the cached index file, which
+        changes whenever the file is modified
+        """
+        st = os.stat(self._index_path)
+        return [st.st_size, st.st_mtime, st.st_ino]
+
+    def cache_is_valid(self, metadata=None, verify=False):
+        """
+        Return True if the cached index matches the metadata.  Unless
+        verify is True, the file size, mtime and inode recorded in the
+        metadata are compared, and the (more expensive) MD5 sum is only
+        checked when those are missing or have changed, in which case the
+        new stat is recorded when the MD5 sum matches.
+        """
         metadata = metadata or self.read_metadata()
         if ('etag' in metadata  # metadata has an etag
             and 'md5' in metadata  # and an md5 sum
             and os.path.exists(self._index_path)  # and the index exists
             ):
+            stat = self._index_stat()
+            if not verify and metadata.get('stat') == stat:
+                return True
+
             # All the data is there, check if it's valid
             sum = md5()
             for line in open(self._index_path, 'rb'):
@@ -36,21 +58,35 @@ class CachedHandler(urllib2.BaseHandler):
 
             # And if so, add an etag header
             if metadata['md5'] == sum.hexdigest():
+                if metadata.get('stat') != stat:
+                    self.write_metadata(dict(metadata, stat=stat))
                 return True
         return False
 
+    def write_metadata(self, metadata):
+        """
+        Replace the metadata of the cached index.
+        """
+        tmp_path = self._metadata_path + '.part'
+        try:
+            with open(tmp_path, 'wb') as fo:
+                json.dump(metadata, fo)
+            if os.path.exists(self._metadata_path):
+                os.remove(self._metadata_path)
+            os.rename(tmp_path, self._metadata_path)
+        except (IOError, OSError):
+            # the stat is only an optimization
+            pass
+
     def clear_cache(self):
-        for path in self._metadata_path, self._index_path:
+        for path in (self._metadata_path, self._index_path,
+                     self._digest_path):
             try:
-                os.remove(self._metadata_path)
+                os.remove(path)
             except OSError:
                 pass
 
     def fill_cache(self, etag, content):
-        metadata = {
-            'etag': etag,
-            'md5': md5(content).hexdigest(),
-        }
         try:
             os.makedirs(os.path.dirname(self._index_path))
         except OSError as e:
@@ -59,15 +95,91 @@ class CachedHandler(urllib2.BaseHandler):
                 pass
             else:
                 raise
-        open(self._index_path, 'wb').write(content)
-        json.dump(metadata, open(self._metadata_path, 'wb'))
+        with open(self._index_path, 'wb') as fo:
+            fo.write(content)
+        metadata = {
+            'etag': etag,
+            'md5': md5(content).hexdigest(),
+            'stat': self._index_stat(),
+        }
+        with open(self._metadata_path, 'wb') as fo:
+            json.dump(metadata, fo)
+
+    def read_digest(self, key):
+        """
+        Return the data which was stored by write_digest for the same key,
+        or None if there is no such data.  The key is usually derived from
+        the MD5 sum of the cached index, such that the digest (e.g. the
+        parsed index) is only used as long as the index does not change.
+        """
+        try:
+            with open(self._digest_path, 'rb') as fi:
+                if marshal.load(fi) != key:
+                    return None
+                return marshal.load(fi)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+    def write_digest(self, key, data):
+        """
+        Store data (which has to be marshallable) in a binary file next
+        to the cached index.
+        """
+        tmp_path = self._digest_path + '.part'
+        try:
+            with open(tmp_path, 'wb') as fo:
+                marshal.dump(key, fo)
+                marshal.dump(data, fo)
+            if os.path.exists(self._digest_path):
+                os.remove(self._digest_path)
+            os.rename(tmp_path, self._digest_path)
+        except (IOError, OSError):
+            # the digest is only an optimization
+            pass
+
+    def cached_response(self, headers, url, code=200, msg='OK'):
+        """
+        return a response object for the cached index, which carries the
+        MD5 sum of the index as cache_md5
+        """
+        res = urllib2.addinfourl(open(self._index_path, 'rb'), headers, url)
+        res.code = code
+        res.msg = msg
+        res.cache_md5 = self.read_metadata()['md5']
+        return res
+
+    def apply_deltas(self, deltas, url):
+        """
+        Patch the cached index with a chain of deltas (as written by
+        egg_meta.write_deltas), each containing the 'changed' entries, the
+        'removed' keys and the 'md5' sum of the resulting index.  Returns
+        the response for the updated index, or None when the result does
+        not match the expected MD5 sum (and the index has to be fetched).
+        """
+        if not deltas:
+            return self.cached_response({}, url)
+
+        index = json.load(open(self._index_path, 'rb'))
+        for delta in deltas:
+            index.update(delta['changed'])
+            for key in delta['removed']:
+                index.pop(key, None)
+        content = json.dumps(index, indent=2, sort_keys=True)
+        if md5(content).hexdigest() != deltas[-1]['md5']:
+            return None
+
+        # the etag of the new index is not known, so the next conditional
+        # request (if any) will fetch the full index again
+        self.fill_cache('', content)
+        return self.cached_response({}, url)
 
     # BaseHandler API Methods #
 
     def http_request(self, req):
         metadata = self.read_metadata()
 
-        if self.cache_re.search(req.get_full_url()) and self.cache_is_valid(metadata):
+        if (self.cache_re.search(req.get_full_url()) and
+                self.cache_is_valid(metadata) and metadata['etag']):
             req.headers['If-None-Match'] = metadata['etag']
 
         return req
@@ -75,27 +187,21 @@ class CachedHandler(urllib2.BaseHandler):
     https_request = http_request
 
     def http_error_304(self, req, fp, code, msg, headers):
+        fp.close()
         metadata = self.read_metadata()
 
         if not self.cache_is_valid(metadata):
             self.clear_cache()
             return self.parent.open(req.get_full_url())
 
-        res = urllib2.addinfourl(open(self._index_path, 'rb'),
-                                 headers, req.get_full_url())
-        res.code = code
-        res.msg = msg
-        return res
+        return self.cached_response(headers, req.get_full_url(), code, msg)
 
     def http_response(self, req, response):
         etag = response.headers.get('Etag')
         if etag and response.code == 200 and self.cache_re.search(response.url):
             self.fill_cache(etag, response.read())
-            res = urllib2.addinfourl(open(self._index_path, 'rb'),
-                                          response.headers, response.url)
-            res.code = response.code
-            res.msg = response.msg
-            return res
+            return self.cached_response(response.headers, response.url,
+                                        response.code, response.msg)
 
         return response
 
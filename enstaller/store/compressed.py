@@ -1,18 +1,82 @@
-from cStringIO import StringIO
 import bz2
-import gzip
+import zlib
 import urllib2
 
 
+class DecompressingFile(object):
+    """
+    File-like object, which decompresses the data read from the underlying
+    file object fp incrementally, using the given decompressor object
+    (e.g. bz2.BZ2Decompressor), so that memory usage is bounded by the
+    size of the chunks being read.
+    """
+    def __init__(self, fp, decompressor, buffsize=16384):
+        self.fp = fp
+        self._decompressor = decompressor
+        self.buffsize = buffsize
+        self._buf = ''
+        self._eof = False
+
+    def _fill(self, size):
+        """
+        decompress data until at least size bytes are buffered, or the end
+        of the data is reached
+        """
+        chunks = [self._buf]
+        n = len(self._buf)
+        while not self._eof and (size < 0 or n < size):
+            data = self.fp.read(self.buffsize)
+            if data:
+                data = self._decompressor.decompress(data)
+            else:
+                self._eof = True
+                if hasattr(self._decompressor, 'flush'):
+                    data = self._decompressor.flush()
+            chunks.append(data)
+            n += len(data)
+        self._buf = ''.join(chunks)
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        self._fill(size)
+        if size < 0:
+            res, self._buf = self._buf, ''
+        else:
+            res, self._buf = self._buf[:size], self._buf[size:]
+        return res
+
+    def readline(self, size=-1):
+        while '\n' not in self._buf and not self._eof:
+            self._fill(len(self._buf) + self.buffsize)
+        i = self._buf.find('\n') + 1 or len(self._buf)
+        if 0 <= size < i:
+            i = size
+        res, self._buf = self._buf[:i], self._buf[i:]
+        return res
+
+    def readlines(self):
+        return list(iter(self.readline, ''))
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def close(self):
+        self.fp.close()
+
+
 class CompressedHandler(urllib2.BaseHandler):
     compression_types = [
-        ('bzip2', bz2.decompress),
-        ('gzip', lambda data: gzip.GzipFile(fileobj=StringIO(data)).read()),
-        ('*', lambda data: data)
+        ('bzip2', bz2.BZ2Decompressor),
+        # 16 + MAX_WBITS makes zlib expect (and skip) the gzip header
+        ('gzip', lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)),
+        ('*', None)
     ]
 
     def http_request(self, req):
-        if not req.headers.get('Accept-Encoding'):
+        # add_header stores the header as 'Accept-encoding'
+        if not (req.has_header('Accept-encoding') or
+                req.headers.get('Accept-Encoding')):
             req.headers['Accept-Encoding'] = ','.join(
                 [enc for enc, _ in self.compression_types])
         return req
@@ -24,10 +88,14 @@ class CompressedHandler(urllib2.BaseHandler):
         if not content_encoding:
             return response
 
-        for encoding, decompress in self.compression_types:
-            if encoding in content_encoding:
-                decompressed = decompress(response.read())
-                response.read = lambda: decompressed
+        for encoding, decompressor in self.compression_types:
+            if decompressor and encoding in content_encoding:
+                res = urllib2.addinfourl(
+                    DecompressingFile(response, decompressor()),
+                    response.headers, response.url)
+                res.code = response.code
+                res.msg = response.msg
+                return res
 
         return response
 
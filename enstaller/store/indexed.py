@@ -1,13 +1,21 @@
+import re
+import os
 import json
+import hashlib
+import threading
 import urlparse
 import urllib2
 from collections import defaultdict
-from os.path import join
+from os.path import isdir, isfile, join
 
 from base import AbstractStore
 from cached import CachedHandler
 from compressed import CompressedHandler
+from keepalive import (KeepAliveHTTPHandler, KeepAliveHTTPSHandler,
+                       is_http_handler)
 from enstaller import config
+from enstaller.utils import PY_VER, version_key
+from enstaller.egg_meta import shard_name
 
 
 class IndexedStore(AbstractStore):
@@ -15,20 +23,37 @@ class IndexedStore(AbstractStore):
     def connect(self, userpass=None):
         self.userpass = userpass  # tuple(username, password)
 
-        self._index = self.get_index()
+        self._set_index(self.get_index())
 
-        #for k, v in self._index.iteritems():
+    def _set_index(self, index):
+        """
+        set the index (as obtained from the index.json file), add the
+        default values to all entries, and group the keys by name
+        """
+        self._index = {}
+        # maps names to keys
+        self._groups = defaultdict(list)
+        self._update_index(index)
+
+    def _update_index(self, index):
+        """
+        add the entries of index (with default values) to the index
+        """
+        #for k, v in index.iteritems():
         #    print k, v
 
-        for info in self._index.itervalues():
-            info['store_location'] = self.info().get('root')
+        location = self.info().get('root')
+        for key, info in index.iteritems():
+            if key in self._index:
+                continue
+            info['store_location'] = location
             info.setdefault('type', 'egg')
             info.setdefault('python', '2.7')
             info.setdefault('packages', [])
-
-        # maps names to keys
-        self._groups = defaultdict(list)
-        for key, info in self._index.iteritems():
+            if 'version' in info and 'build' in info:
+                # the key used for sorting by version and build number
+                info['sort_key'] = version_key(info['version']), info['build']
+            self._index[key] = info
             self._groups[info['name']].append(key)
 
     def get_index(self):
@@ -84,11 +109,19 @@ class LocalIndexedStore(IndexedStore):
         except IOError as e:
             raise KeyError(str(e))
 
+    def get_partial_data(self, key, offset):
+        fi = self.get_data(key)
+        fi.seek(offset)
+        return fi, offset
+
 
 class RemoteHTTPIndexedStore(IndexedStore):
 
-    def __init__(self, url, cache_dir=None):
+    def __init__(self, url, cache_dir=None, deltas=False):
         self.root = url
+        # whether the repository publishes index deltas (see
+        # egg_meta.write_deltas), which are only looked for when it does
+        self.deltas = deltas
 
         # Use handlers from urllib2's default opener, since we already
         # added our proxy handler to it.
@@ -96,23 +129,113 @@ class RemoteHTTPIndexedStore(IndexedStore):
         http_handlers = [urllib2.HTTPHandler, urllib2.HTTPSHandler]
         handlers = opener.handlers if opener is not None else http_handlers
 
-        # Add our handlers to the default handlers.
+        # Add our handlers to the default handlers, the plain HTTP(S)
+        # handlers are replaced by ones which keep connections alive.
         if cache_dir is None:
             cache_dir = config.get('local')
-        handlers_ = [CompressedHandler, CachedHandler(cache_dir)] + handlers
+        self.cache_dir = cache_dir
+        self._cached_handler = CachedHandler(cache_dir)
+        handlers_ = ([CompressedHandler, self._cached_handler,
+                      KeepAliveHTTPHandler(), KeepAliveHTTPSHandler()] +
+                     [h for h in handlers if not is_http_handler(h)])
 
         self.opener = urllib2.build_opener(*handlers_)
 
     def info(self):
         return dict(root=self.root)
 
-    def get_index(self):
+    # changed whenever the entries stored in the digest change
+    digest_format = 2
+
+    def connect(self, userpass=None):
+        self.userpass = userpass  # tuple(username, password)
+
+        fp = self._get_index_fp()
+        # When the index was served from (or written to) the cache, the
+        # index with defaults and groups might already be stored in binary
+        # form, which is a lot faster to load than parsing the JSON data.
+        key = getattr(fp, 'cache_md5', None)
+        if key is not None:
+            key = [key, self.root, PY_VER, self.digest_format]
+            digest = self._cached_handler.read_digest(key)
+            if digest is not None:
+                fp.close()
+                self._index = digest['index']
+                self._groups = defaultdict(list, digest['groups'])
+                return
+
+        self._set_index(json.load(fp))
+        fp.close()
+        if key is not None:
+            self._cached_handler.write_digest(key, dict(
+                    index=self._index, groups=dict(self._groups)))
+
+    # the maximal number of index deltas applied to the cached index
+    max_deltas = 20
+
+    def _get_delta_index_fp(self):
+        """
+        Bring the cached index up to date by following the chain of index
+        deltas published by the repository (see egg_meta.write_deltas),
+        starting at the MD5 sum of the cached index.  Returns the response
+        for the updated index, or None if that is not possible (including
+        when a delta is missing or malformed), in which case the full index
+        is fetched.
+        """
+        if not self.deltas:
+            return None
+        metadata = self._cached_handler.read_metadata()
+        if not self._cached_handler.cache_is_valid(metadata):
+            return None
+
+        deltas = []
+        md5 = metadata['md5']
+        try:
+            while len(deltas) <= self.max_deltas:
+                fp = self.get_data('deltas/%s.json' % md5)
+                try:
+                    delta = json.load(fp)
+                finally:
+                    fp.close()
+                if delta['md5'] == md5:
+                    # reached the current index
+                    return self._cached_handler.apply_deltas(
+                        deltas, self._location('index.json'))
+                deltas.append(delta)
+                md5 = delta['md5']
+        except Exception:
+            # no delta for this index (KeyError), a response which is not
+            # a delta (ValueError, KeyError, TypeError), or no connection
+            return None
+        return None
+
+    def _get_index_fp(self):
+        fp = self._get_delta_index_fp()
+        if fp is not None:
+            return fp
         fp = self.get_data('index.json?pypi=true')
         if fp is None:
             raise Exception("could not connect")
-        return json.load(fp)
+        return fp
+
+    def get_index(self):
+        return json.load(self._get_index_fp())
 
     def get_data(self, key):
+        return self._open(key)
+
+    def get_partial_data(self, key, offset):
+        # the range refers to the encoded data, so no compression is
+        # requested, and the server might simply send the whole data
+        fp = self._open(key, {'Range': 'bytes=%d-' % offset,
+                              'Accept-Encoding': 'identity'})
+        content_range = fp.headers.get('Content-Range', '')
+        m = re.match(r'bytes\s+(\d+)-', content_range)
+        if fp.code == 206 and m and int(m.group(1)) == offset:
+            return fp, offset
+        return fp, 0
+
+    def _open(self, key, headers={}):
         url = self._location(key)
         scheme, netloc, path, params, query, frag = urlparse.urlparse(url)
         auth, host = urllib2.splituser(netloc)
@@ -130,9 +253,84 @@ class RemoteHTTPIndexedStore(IndexedStore):
         else:
             request = urllib2.Request(url)
         request.add_header('User-Agent', 'enstaller')
+        for name, value in headers.iteritems():
+            request.add_header(name, value)
         try:
             return self.opener.open(request)
         except urllib2.HTTPError as e:
             raise KeyError("%s: %s" % (e, url))
         except urllib2.URLError as e:
             raise Exception("Could not connect to %s" %(host,))
+
+
+class ShardedHTTPIndexedStore(RemoteHTTPIndexedStore):
+    """
+    Remote store for repositories with a sharded index (see
+    egg_meta.write_shards), which consists of one small index file per
+    project name and a manifest mapping the names to the MD5 sums of
+    their index files.  Connecting only fetches the manifest, the index of
+    a name is fetched (and cached on disk) when the name is first used,
+    and the full index only for queries without a name.
+    """
+    def __init__(self, url, cache_dir=None, deltas=False):
+        RemoteHTTPIndexedStore.__init__(self, url, cache_dir, deltas)
+        self._shards_dir = join(self.cache_dir, 'index_cache', 'shards',
+                                hashlib.md5(url).hexdigest())
+        self._lock = threading.RLock()
+
+    def connect(self, userpass=None):
+        self.userpass = userpass  # tuple(username, password)
+
+        fp = self.get_data('shards.json')
+        self._manifest = json.load(fp)
+        fp.close()
+        self._set_index({})
+        self._loaded = set()
+        self._complete = False
+
+    def _read_shard(self, name):
+        md5 = self._manifest[name]
+        path = join(self._shards_dir, name + '.json')
+        if isfile(path):
+            data = open(path, 'rb').read()
+            if hashlib.md5(data).hexdigest() == md5:
+                return data
+
+        data = self.get_data('shards/%s.json' % name).read()
+        if hashlib.md5(data).hexdigest() != md5:
+            raise Exception("index shard %r does not match manifest" % name)
+        if not isdir(self._shards_dir):
+            os.makedirs(self._shards_dir)
+        with open(path, 'wb') as fo:
+            fo.write(data)
+        return data
+
+    def _load_shard(self, name):
+        with self._lock:
+            if self._complete or name in self._loaded:
+                return
+            self._loaded.add(name)
+            if name in self._manifest:
+                self._update_index(json.loads(self._read_shard(name)))
+
+    def _load_all(self):
+        with self._lock:
+            if not self._complete:
+                RemoteHTTPIndexedStore.connect(self, self.userpass)
+                self._complete = True
+
+    def get_metadata(self, key):
+        self._load_shard(shard_name(key))
+        return IndexedStore.get_metadata(self, key)
+
+    def exists(self, key):
+        self._load_shard(shard_name(key))
+        return IndexedStore.exists(self, key)
+
+    def query_keys(self, **kwargs):
+        name = kwargs.get('name')
+        if name is None:
+            self._load_all()
+        else:
+            self._load_shard(name)
+        return IndexedStore.query_keys(self, **kwargs)
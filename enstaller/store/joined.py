@@ -25,6 +25,12 @@ class JoinedStore(AbstractStore):
                 return repo.get_data(key)
         raise KeyError(key)
 
+    def get_partial_data(self, key, offset):
+        for repo in self.repos:
+            if repo.exists(key):
+                return repo.get_partial_data(key, offset)
+        raise KeyError(key)
+
     def get_metadata(self, key):
         for repo in self.repos:
             if repo.exists(key):
@@ -0,0 +1,162 @@
+import httplib
+import inspect
+import socket
+import threading
+import urllib2
+from collections import defaultdict
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of idle (persistent) HTTP connections, keyed by the
+    connection class (i.e. scheme), the host and the tunnel host (when
+    connecting through a proxy).
+    """
+    def __init__(self, max_idle=8):
+        self.max_idle = max_idle
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        return an idle connection for key, or None if there is none
+        """
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop()
+        return None
+
+    def put(self, key, conn):
+        with self._lock:
+            if len(self._idle[key]) < self.max_idle:
+                self._idle[key].append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, defaultdict(list)
+        for conns in idle.itervalues():
+            for conn in conns:
+                conn.close()
+
+
+# connections are shared by all handlers (and therefore all stores) which
+# are created without an explicit pool
+default_pool = ConnectionPool()
+
+
+class _Releaser(object):
+    """
+    Wraps an httplib.HTTPResponse, such that its connection is given back
+    to the pool once the response body has been read completely.  A
+    response which is closed before being read completely takes its
+    connection down with it.
+    """
+    def __init__(self, pool, key, conn, response):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+
+    def recv(self, amt=None):
+        data = self._response.read(amt)
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def _release(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool.put(self._key, conn)
+        else:
+            conn.close()
+
+    def close(self):
+        if not self._response.isclosed() and self._response.length == 0:
+            # nothing left to read (e.g. a 304 response), which finishes
+            # the response, so that the connection can be reused
+            self._response.read()
+        self._release()
+        self._response.close()
+
+
+class KeepAliveMixin(object):
+    """
+    Replaces the do_open method of urllib2's HTTP(S) handlers, which
+    opens a new connection (and sends 'Connection: close') for each
+    request, by one which reuses connections from a ConnectionPool.
+    """
+    def do_open(self, http_class, req, **http_conn_args):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers = dict(
+            (name.title(), val) for name, val in headers.items())
+
+        tunnel_headers = {}
+        if req._tunnel_host:
+            proxy_auth_hdr = "Proxy-Authorization"
+            if proxy_auth_hdr in headers:
+                tunnel_headers[proxy_auth_hdr] = headers[proxy_auth_hdr]
+                # Proxy-Authorization should not be sent to origin server.
+                del headers[proxy_auth_hdr]
+
+        key = (http_class.__name__, host, req._tunnel_host)
+        while True:
+            h = self.pool.get(key)
+            reused = h is not None
+            if not reused:
+                h = http_class(host, timeout=req.timeout, **http_conn_args)
+                h.set_debuglevel(self._debuglevel)
+                if req._tunnel_host:
+                    h.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+            try:
+                h.request(req.get_method(), req.get_selector(), req.data,
+                          headers)
+                r = h.getresponse(buffering=True)
+            except (socket.error, httplib.HTTPException), err:
+                h.close()
+                # the server might have closed an idle connection, in which
+                # case the request is retried on a fresh one
+                if reused and req.get_method() in ('GET', 'HEAD'):
+                    continue
+                raise urllib2.URLError(err)
+            break
+
+        fp = socket._fileobject(_Releaser(self.pool, key, h, r), close=True)
+        resp = urllib2.addinfourl(fp, r.msg, req.get_full_url())
+        resp.code = r.status
+        resp.msg = r.reason
+        return resp
+
+
+class KeepAliveHTTPHandler(KeepAliveMixin, urllib2.HTTPHandler):
+
+    def __init__(self, pool=None, debuglevel=0):
+        urllib2.HTTPHandler.__init__(self, debuglevel)
+        self.pool = default_pool if pool is None else pool
+
+
+class KeepAliveHTTPSHandler(KeepAliveMixin, urllib2.HTTPSHandler):
+
+    def __init__(self, pool=None, debuglevel=0, **kwargs):
+        urllib2.HTTPSHandler.__init__(self, debuglevel, **kwargs)
+        self.pool = default_pool if pool is None else pool
+
+
+def is_http_handler(handler):
+    """
+    return True if handler is an HTTP(S) handler (class or instance), which
+    would be replaced by the keep-alive handlers
+    """
+    http_classes = (urllib2.HTTPHandler, urllib2.HTTPSHandler)
+    if inspect.isclass(handler):
+        return issubclass(handler, http_classes)
+    return isinstance(handler, http_classes)
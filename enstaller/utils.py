@@ -1,5 +1,6 @@
 import sys
 import hashlib
+import heapq
 from os.path import abspath, expanduser, getmtime, getsize, isdir, isfile, join
 
 from verlib import NormalizedVersion, IrrationalVersionError
@@ -46,6 +47,107 @@ def comparable_version(version):
         return version
 
 
+# maps version strings to the keys returned by version_key
+_version_keys = {}
+
+def version_key(version):
+    """
+    Like comparable_version, but returns a tuple (of ints and strings),
+    which is cheap to compare, and which is only computed once for each
+    version string.  Unlike the objects returned by comparable_version,
+    all keys are comparable with each other: versions which can not be
+    normalized sort before all others.
+    """
+    try:
+        return _version_keys[version]
+    except KeyError:
+        pass
+    ver = comparable_version(version)
+    if isinstance(ver, NormalizedVersion):
+        res = (1,) + ver.parts
+    else:
+        res = (0, ver)
+    _version_keys[version] = res
+    return res
+
+
+def install_order(items, name, required_names):
+    """
+    Given the 'items' (e.g. eggs), a function which returns the (project)
+    name of an item, and a function which returns the names required by an
+    item, return a list of the items in which each item comes after all
+    items it requires.  All required names must be names of the items.
+
+    The order is deterministic: the items are placed in passes over the
+    items sorted by name, where each pass places every item (in sorted
+    order) whose requirements have been placed already.  This is done in
+    linear time (apart from sorting), using Kahn's algorithm, where an item
+    which becomes ready after the current position is placed in the current
+    pass, and otherwise in the next one.
+
+    Raises an exception listing the members of a cycle, if the
+    requirements contain one.
+    """
+    items = sorted(items, key=name)
+    index = dict((name(item), i) for i, item in enumerate(items))
+    # maps position -> list of positions of the items it requires
+    requires = [sorted(set(index[n] for n in required_names(item)))
+                for item in items]
+    # maps position -> list of positions of the items which require it
+    dependents = [[] for item in items]
+    missing = [len(reqs) for reqs in requires]
+    for i, reqs in enumerate(requires):
+        for j in reqs:
+            dependents[j].append(i)
+
+    # heap of tuple(pass, position) of the items ready to be placed
+    ready = [(0, i) for i, n in enumerate(missing) if n == 0]
+    result = []
+    while ready:
+        p, i = heapq.heappop(ready)
+        result.append(items[i])
+        for j in dependents[i]:
+            missing[j] -= 1
+            if missing[j] == 0:
+                heapq.heappush(ready, (p if j > i else p + 1, j))
+
+    if len(result) < len(items):
+        # each remaining item requires at least one remaining item,
+        # so following these requirements must lead into a cycle
+        path = []
+        i = min(i for i, n in enumerate(missing) if n)
+        while i not in path:
+            path.append(i)
+            i = min(j for j in requires[i] if missing[j])
+        cycle = path[path.index(i):] + [i]
+        raise Exception("Loop in dependency graph: %s" %
+                        ' -> '.join(name(items[i]) for i in cycle))
+    return result
+
+
+def install_levels(items, name, required_names):
+    """
+    Given the 'items' in install order (see install_order), and the same
+    functions as install_order, return a list of levels (lists of items),
+    such that each item comes after all the items it requires, which are
+    in earlier levels.  The items of one level do not require each other,
+    so they may be installed concurrently.  Required names which are not
+    names of earlier items (e.g. of packages already installed) are
+    ignored.  The items keep their order within each level.
+    """
+    # maps names -> level of the items placed so far
+    level = {}
+    levels = []
+    for item in items:
+        i = max([level[n] + 1 for n in required_names(item) if n in level]
+                or [0])
+        level[name(item)] = i
+        if i == len(levels):
+            levels.append([])
+        levels[i].append(item)
+    return levels
+
+
 def md5_file(path):
     """
     Returns the md5sum of the file (located at `path`) as a hexadecimal
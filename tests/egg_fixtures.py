@@ -0,0 +1,58 @@
+"""
+Helpers for creating (small) eggs and repositories of eggs in the tests.
+"""
+import json
+import zipfile
+from os.path import join
+
+from enstaller.utils import info_file
+
+
+DEPEND = """\
+metadata_version = '1.1'
+name = %(name)r
+version = %(version)r
+build = 1
+
+arch = None
+platform = None
+osdist = None
+python = None
+packages = %(packages)r
+"""
+
+
+def create_egg(path, name, version='1.0', packages=[], members={}):
+    """
+    create an egg at path, which contains the module <name>.py, its
+    EGG-INFO/spec/depend (listing the requirements packages), and the
+    archive members given by the dictionary members (mapping archive
+    names to data)
+    """
+    with zipfile.ZipFile(path, "w") as fp:
+        fp.writestr("EGG-INFO/spec/depend",
+                    DEPEND % dict(name=name, version=version,
+                                  packages=packages))
+        fp.writestr("%s.py" % name, "# module %s\n" % name)
+        for arcname, data in sorted(members.iteritems()):
+            fp.writestr(arcname, data)
+
+
+def create_repo(repo_dir, eggs, deps={}, members=lambda name: {}):
+    """
+    create the given eggs (filenames) and the index.json of the
+    repository in repo_dir, where deps maps names to the list of
+    requirements of the eggs of that name, and members is called with the
+    name of each egg for the additional archive members of the egg
+    """
+    index = {}
+    for egg in eggs:
+        path = join(repo_dir, egg)
+        name, version = egg.split('-')[:2]
+        packages = deps.get(name, [])
+        create_egg(path, name, version, packages, members(name))
+        info = info_file(path)
+        info.update(name=name, version=version, build=1, packages=packages)
+        index[egg] = info
+    with open(join(repo_dir, 'index.json'), 'w') as fo:
+        json.dump(index, fo)
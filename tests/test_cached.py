@@ -27,7 +27,8 @@ class CacheTest(TestCase):
         except: pass
 
     def _write_cache(self, data, metadata=None):
-        os.mkdir(os.path.join(self.cache_dir, 'index_cache'))
+        if not os.path.isdir(os.path.join(self.cache_dir, 'index_cache')):
+            os.mkdir(os.path.join(self.cache_dir, 'index_cache'))
         if data:
             open(self.index_path, 'wb').write(data)
         metadata = metadata or {'etag': 'test-etag',
@@ -38,6 +39,40 @@ class CacheTest(TestCase):
         self._write_cache('foobly')
         self.assertTrue(self.cache_handler.cache_is_valid())
 
+    def test_valid_cache_stat(self):
+        """ A matching stat is enough, unless verify is used """
+        self._write_cache('foobly')
+        st = os.stat(self.index_path)
+        self._write_cache(None, {'etag': 'test-etag', 'md5': 'notright',
+                                 'stat': [st.st_size, st.st_mtime,
+                                          st.st_ino]})
+        self.assertTrue(self.cache_handler.cache_is_valid())
+        self.assertFalse(self.cache_handler.cache_is_valid(verify=True))
+
+    def test_modified_cache_stat(self):
+        """ A changed stat falls back to the md5 sum """
+        self._write_cache('foobly', {'etag': 'test-etag',
+                                     'md5': hashlib.md5('foobly').hexdigest(),
+                                     'stat': [0, 0, 0]})
+        self.assertTrue(self.cache_handler.cache_is_valid())
+        open(self.index_path, 'ab').write('!')
+        self.assertFalse(self.cache_handler.cache_is_valid())
+
+    def test_refresh_cache_stat(self):
+        """ The new stat is recorded once the md5 sum matches """
+        self._write_cache('foobly', {'etag': 'test-etag',
+                                     'md5': hashlib.md5('foobly').hexdigest(),
+                                     'stat': [0, 0, 0]})
+        self.assertTrue(self.cache_handler.cache_is_valid())
+        st = os.stat(self.index_path)
+        metadata = json.load(open(self.metadata_path))
+        self.assertEqual(metadata['stat'],
+                         [st.st_size, st.st_mtime, st.st_ino])
+        self.assertEqual(metadata['etag'], 'test-etag')
+        # the stat alone is enough now
+        self._write_cache(None, dict(metadata, md5='notright'))
+        self.assertTrue(self.cache_handler.cache_is_valid())
+
     def test_invalid_metadata(self):
         self._write_cache('foobly', {'etag': 'whatever', 'md5': 'notright'})
         self.assertFalse(self.cache_handler.cache_is_valid())
@@ -66,7 +101,8 @@ class CacheTest(TestCase):
         res = urllib2.addinfourl(StringIO('hello'), {'Etag': 'returned-etag'}, 'http://redirected.com/index-foo.json')
         res.code = 200
         res.msg = 'OK'
-        self.cache_handler.http_response(req, res)
+        res = self.cache_handler.http_response(req, res)
+        self.assertEqual(res.cache_md5, hashlib.md5('hello').hexdigest())
         self.assertTrue(os.path.exists(self.index_path))
         self.assertTrue(os.path.exists(self.metadata_path))
         metadata = json.load(open(self.metadata_path, 'rb'))
@@ -79,6 +115,18 @@ class CacheTest(TestCase):
         res = self.cache_handler.http_error_304(req, StringIO(''), '304', 'Not Modified', {'Etag': 'test-etag'})
         self.assertEqual(res.read(), 'hello again')
         self.assertEqual(res.headers['Etag'], 'test-etag')
+        self.assertEqual(res.cache_md5,
+                         hashlib.md5('hello again').hexdigest())
+
+    def test_digest(self):
+        self._write_cache('hello')
+        self.assertEqual(self.cache_handler.read_digest('key'), None)
+        data = {'index': {u'a-1.0-1.egg': {u'name': u'a'}}}
+        self.cache_handler.write_digest(['key', 1], data)
+        self.assertEqual(self.cache_handler.read_digest(['key', 1]), data)
+        self.assertEqual(self.cache_handler.read_digest(['key', 2]), None)
+        self.cache_handler.clear_cache()
+        self.assertEqual(self.cache_handler.read_digest(['key', 1]), None)
 
     def test_no_etag(self):
         """ No Etag header == no cache written """
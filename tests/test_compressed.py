@@ -0,0 +1,63 @@
+import bz2
+import gzip
+import unittest
+import urllib2
+from cStringIO import StringIO
+
+from enstaller.store.compressed import CompressedHandler
+
+
+DATA = ''.join('line %d of some index data\n' % i for i in xrange(5000))
+
+
+def gzip_compress(data):
+    f = StringIO()
+    g = gzip.GzipFile(fileobj=f, mode='wb')
+    g.write(data)
+    g.close()
+    return f.getvalue()
+
+
+class TestCompressedHandler(unittest.TestCase):
+
+    def _response(self, data, encoding=None):
+        headers = {'Content-Encoding': encoding} if encoding else {}
+        res = urllib2.addinfourl(StringIO(data), headers,
+                                 'http://foo.com/index.json')
+        res.code = 200
+        res.msg = 'OK'
+        req = urllib2.Request('http://foo.com/index.json')
+        return CompressedHandler().http_response(req, res)
+
+    def test_accept_encoding(self):
+        req = urllib2.Request('http://foo.com/index.json')
+        req = CompressedHandler().http_request(req)
+        self.assertEqual(req.headers['Accept-Encoding'], 'bzip2,gzip,*')
+
+    def test_identity(self):
+        req = urllib2.Request('http://foo.com/foo-1.0-1.egg')
+        req.add_header('Accept-Encoding', 'identity')
+        req = CompressedHandler().http_request(req)
+        self.assertEqual(req.header_items(),
+                         [('Accept-encoding', 'identity')])
+
+    def test_read_all(self):
+        for data, encoding in [(bz2.compress(DATA), 'bzip2'),
+                               (gzip_compress(DATA), 'gzip'),
+                               (DATA, None)]:
+            res = self._response(data, encoding)
+            self.assertEqual(res.read(), DATA)
+            self.assertEqual(res.code, 200)
+
+    def test_read_chunks(self):
+        for data, encoding in [(bz2.compress(DATA), 'bzip2'),
+                               (gzip_compress(DATA), 'gzip')]:
+            res = self._response(data, encoding)
+            chunks = list(iter(lambda: res.read(1000), ''))
+            self.assertTrue(all(len(c) == 1000 for c in chunks[:-1]))
+            self.assertEqual(''.join(chunks), DATA)
+
+    def test_readline(self):
+        res = self._response(gzip_compress(DATA), 'gzip')
+        self.assertEqual(res.readline(), 'line 0 of some index data\n')
+        self.assertEqual(res.readlines(), DATA.splitlines(True)[1:])
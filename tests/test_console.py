@@ -0,0 +1,42 @@
+import sys
+import unittest
+from cStringIO import StringIO
+
+from egginst.console import ProgressManager
+
+
+def _progress(filename):
+    return ProgressManager(None, None, None, 'fetching', 100, 'fetching',
+                           filename, '1 KB', None)
+
+
+class TestProgressManager(unittest.TestCase):
+
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def test_deferred(self):
+        a, b, c = [_progress(fn) for fn in 'abc']
+        with a:
+            with b:
+                b(step=50)
+            try:
+                with c:
+                    raise ValueError
+            except ValueError:
+                pass
+            a(step=50)
+        lines = sys.stdout.getvalue().splitlines()
+        # the failed operation c is not shown as finished
+        self.assertEqual([line.split()[0] for line in lines[::2]],
+                         ['a', 'b'])
+        self.assertEqual(lines[1].split()[-1], '[' + 65 * '.' + ']')
+        self.assertEqual(lines[3].split()[-1], '[' + 65 * '.' + ']')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ import zipfile
 
 import os.path as op
 
+from egginst.archive import Archive
 from egginst.main import EggInst
 from egginst.utils import makedirs, zip_write_symlink
 
@@ -43,3 +44,218 @@ class TestEggInst(unittest.TestCase):
         self.assertTrue(op.islink(link))
         self.assertEqual(os.readlink(link), "include")
         self.assertTrue(op.exists(op.join(link, "foo.h")))
+
+
+def _create_big_egg(filename):
+    with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as fp:
+        for i in range(50):
+            fp.writestr("foo/mod%d.py" % i, "x = %d\n" % i * 100)
+        fp.writestr("foo/__init__.py", "")
+        fp.writestr("foo/data.bin", "".join(chr(i % 251) for i in range(10 ** 6)))
+        fp.writestr("ns/__init__.py",
+                    "__import__('pkg_resources').declare_namespace(__name__)")
+        fp.writestr("ns/__init__.pyc", "compiled")
+        fp.writestr("EGG-INFO/usr/bin/foo", "#!/bin/sh\n")
+        fp.writestr("EGG-INFO/usr/lib/libfoo.so.1", "library")
+        fp.writestr("EGG-INFO/usr/include/foo.h", "/* header */")
+        if SUPPORT_SYMLINK:
+            zip_write_symlink(fp, "EGG-INFO/usr/lib/libfoo.so", "libfoo.so.1")
+            zip_write_symlink(fp, "EGG-INFO/usr/HEADERS", "include")
+            # written through the symbolic link above
+            fp.writestr("EGG-INFO/usr/HEADERS/bar.h", "/* bar */")
+
+
+def _tree(prefix):
+    res = {}
+    for root, dirs, files in os.walk(prefix):
+        for fn in dirs + files:
+            path = op.join(root, fn)
+            rel = op.relpath(path, prefix)
+            if op.islink(path):
+                res[rel] = 'link', os.readlink(path)
+            elif op.isfile(path):
+                if fn in ('_info.json', 'egginst.json',
+                          'EGG-INFO-index.json'):
+                    continue
+                res[rel] = (open(path, 'rb').read(),
+                            os.stat(path).st_mode & 0777)
+    return res
+
+
+class TestExtract(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.egg_path = op.join(self.base_dir, "foo-1.0-1.egg")
+        _create_big_egg(self.egg_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def test_parallel(self):
+        trees = []
+        files = []
+        for workers in 1, 4:
+            prefix = op.join(self.base_dir, "prefix%d" % workers)
+            installer = EggInst(self.egg_path, prefix=prefix,
+                                extract_workers=workers)
+            installer.install()
+            trees.append(_tree(prefix))
+            files.append([op.relpath(p, prefix) for p in installer.files])
+        self.assertEqual(trees[0], trees[1])
+        self.assertEqual(files[0], files[1])
+        self.assertTrue(op.join("bin", "foo") in trees[0])
+        self.assertEqual(trees[0][op.join("bin", "foo")][1], 0755)
+
+    def test_chunks(self):
+        path = op.join(self.base_dir, "data.bin")
+        installer = EggInst(self.egg_path, prefix=self.base_dir)
+        installer.chunk_size = 300000
+        reported = []
+        z = zipfile.ZipFile(self.egg_path)
+        try:
+            installer.write_file(z, "foo/data.bin", path, None, False,
+                                 report=reported.append)
+            data = z.read("foo/data.bin")
+        finally:
+            z.close()
+        self.assertEqual(reported, [300000, 600000, 900000, 1000000])
+        self.assertEqual(open(path, 'rb').read(), data)
+
+    def test_chunks_error(self):
+        # the member is closed when writing fails
+        path = op.join(self.base_dir, "data.bin")
+        installer = EggInst(self.egg_path, prefix=self.base_dir)
+        installer.chunk_size = 300000
+        opened = []
+        def report(n):
+            raise IOError("No space left on device")
+        z = zipfile.ZipFile(self.egg_path)
+        z_open = z.open
+        def open_member(name):
+            opened.append(z_open(name))
+            return opened[-1]
+        z.open = open_member
+        try:
+            self.assertRaises(IOError, installer.write_file, z,
+                              "foo/data.bin", path, None, False, report)
+        finally:
+            z.close()
+        self.assertTrue(opened[0].closed)
+
+    def test_archive(self):
+        z = zipfile.ZipFile(self.egg_path)
+        names = z.namelist()
+        z.close()
+        archive = Archive(self.egg_path)
+        try:
+            self.assertEqual(archive.names, names)
+            self.assertTrue("foo/data.bin" in archive)
+            self.assertFalse("foo/data.txt" in archive)
+            self.assertEqual(archive.size("foo/data.bin"), 10 ** 6)
+            self.assertEqual(archive.read("foo/__init__.py"), "")
+        finally:
+            archive.close()
+
+
+class TestUnpackedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.egg_path = op.join(self.base_dir, "foo-1.0-1.egg")
+        _create_big_egg(self.egg_path)
+        with zipfile.ZipFile(self.egg_path, "a") as fp:
+            fp.writestr("EGG-INFO/usr/lib/libbar.so",
+                        "\x7fELF" + 8 * "/PLACEHOLD" + "\0")
+            fp.writestr("EGG-INFO/inst/hook.py", "")
+        self.store_dir = op.join(self.base_dir, "store")
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def _install(self, name, store_dir=None):
+        prefix = op.join(self.base_dir, name)
+        EggInst(self.egg_path, prefix=prefix, store_dir=store_dir).install()
+        return prefix
+
+    def test_link(self):
+        prefix0 = self._install("prefix0")
+        prefix1 = self._install("prefix1", self.store_dir)
+        prefix2 = self._install("prefix2", self.store_dir)
+        trees = [_tree(p) for p in prefix0, prefix1, prefix2]
+        for tree, prefix in zip(trees, [prefix0, prefix1, prefix2]):
+            # the placeholder is replaced by the prefix
+            data = tree.pop(op.join("lib", "libbar.so"))[0]
+            self.assertTrue(data.startswith("\x7fELF" + prefix))
+        # the linked files are read-only
+        for tree in trees:
+            for rel, value in tree.items():
+                if value[0] != 'link':
+                    tree[rel] = value[0], value[1] & 0555
+        self.assertEqual(trees[1], trees[0])
+        self.assertEqual(trees[2], trees[0])
+        self.assertTrue(op.isdir(op.join(self.store_dir, "foo-1.0-1.egg")))
+
+        def same(rel):
+            return op.samefile(op.join(prefix1, rel), op.join(prefix2, rel))
+        self.assertTrue(same(op.join("lib", "libfoo.so.1")))
+        # rewritten after being installed, and therefore copied
+        self.assertFalse(same(op.join("lib", "libbar.so")))
+        self.assertFalse(same(op.join("bin", "foo")))
+        self.assertFalse(same(op.join("EGG-INFO", "foo", "inst", "hook.py")))
+
+    def test_prefixes(self):
+        # changing the files of one prefix does not change another prefix
+        prefix1 = self._install("prefix1", self.store_dir)
+        prefix2 = self._install("prefix2", self.store_dir)
+        tree = _tree(prefix2)
+        for root, dirs, files in os.walk(prefix1):
+            for fn in files:
+                path = op.join(root, fn)
+                if op.islink(path) or fn == 'egginst.json':
+                    continue
+                if not os.stat(path).st_mode & 0222:
+                    # linked files are replaced
+                    os.unlink(path)
+                with open(path, 'ab') as fo:
+                    fo.write('changed')
+        EggInst(self.egg_path, prefix=prefix1).remove()
+        self.assertEqual(_tree(prefix2), tree)
+
+
+class TestCompile(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.egg_path = op.join(self.base_dir, "foo-1.0-1.egg")
+        with zipfile.ZipFile(self.egg_path, "w", zipfile.ZIP_DEFLATED) as fp:
+            for i in range(5):
+                fp.writestr("foo/mod%d.py" % i, "x = %d\n" % i)
+            fp.writestr("foo/__init__.py", "")
+            fp.writestr("foo/__init__.pyc", "compiled")
+            fp.writestr("foo/bad.py", "x = (\n")
+            fp.writestr("EGG-INFO/inst/post.py", "x = 1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def test_compile(self):
+        prefix = op.join(self.base_dir, "prefix")
+        installer = EggInst(self.egg_path, prefix=prefix, compile_workers=2)
+        installer.install()
+        pkg_dir = op.join(installer.site_packages, "foo")
+        pycs = sorted(op.relpath(p, pkg_dir) for p in installer.files
+                      if p.endswith('.pyc'))
+        self.assertEqual(pycs, ['__init__.pyc'] +
+                               ['mod%d.pyc' % i for i in range(5)])
+        # the .pyc file from the archive is kept
+        self.assertEqual(open(op.join(pkg_dir, "__init__.pyc")).read(),
+                         "compiled")
+        self.assertFalse(op.exists(op.join(pkg_dir, "bad.pyc")))
+        self.assertFalse(op.exists(op.join(installer.meta_dir, "inst",
+                                           "post.pyc")))
+
+        installer = EggInst(self.egg_path, prefix=prefix)
+        installer.remove()
+        self.assertFalse(op.exists(pkg_dir))
+
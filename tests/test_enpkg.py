@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import warnings
+from cStringIO import StringIO
+from os.path import isfile, join
+
+from egginst.utils import rel_site_packages
+from enstaller.store.indexed import LocalIndexedStore
+from enstaller.enpkg import Enpkg
+
+from egg_fixtures import create_repo
+
+
+# the hook of an egg records which of the given files exist when it runs,
+# by writing to <prefix>/<name>.hook
+HOOK = """\
+import sys
+from os.path import isfile, join
+res = ' '.join(str(isfile(p)) for p in %(paths)r)
+with open(join(sys.argv[2], %(name)r + '.hook'), 'w') as fo:
+    fo.write(res)
+"""
+
+
+class BlockingStore(LocalIndexedStore):
+    """
+    store in which getting the data of the egg 'blocked' waits (for up to
+    5 seconds) until the event 'unblock' is set, and which records the
+    eggs whose data was read completely in 'log'
+    """
+    def __init__(self, root_dir, blocked, log):
+        LocalIndexedStore.__init__(self, root_dir)
+        self.blocked = blocked
+        self.unblock = threading.Event()
+        self.log = log
+
+    def get_data(self, key):
+        if key == self.blocked:
+            self.unblock.wait(5)
+        fi = LocalIndexedStore.get_data(self, key)
+        data = fi.read()
+        fi.close()
+        self.log.append(('fetched', key))
+        return StringIO(data)
+
+
+class TestExecute(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.repo_dir = join(self.base_dir, 'repo')
+        self.prefix = join(self.base_dir, 'prefix')
+        self.eggs = ['%s-1.0-1.egg' % n for n in 'abcde']
+        os.mkdir(self.repo_dir)
+        create_repo(self.repo_dir, self.eggs)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def _enpkg(self, **kwargs):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return Enpkg(LocalIndexedStore(self.repo_dir), userpass=None,
+                         prefixes=[self.prefix], **kwargs)
+
+    def _actions(self):
+        return ([('fetch_0', egg) for egg in self.eggs] +
+                [('install', egg) for egg in self.eggs])
+
+    def _check_installed(self, enpkg):
+        for egg in self.eggs:
+            self.assertTrue(enpkg.find(egg))
+            self.assertTrue(isfile(join(self.prefix, rel_site_packages,
+                                        egg.split('-')[0] + '.py')))
+
+    def test_execute(self):
+        enpkg = self._enpkg(fetch_workers=2)
+        enpkg.execute(self._actions())
+        self._check_installed(enpkg)
+
+    def test_execute_pipeline(self):
+        enpkg = self._enpkg(fetch_workers=2, pipeline=True)
+        enpkg.execute(self._actions())
+        self._check_installed(enpkg)
+
+    def test_execute_pipeline_update(self):
+        eggs2 = ['%s-2.0-1.egg' % n for n in 'abcde']
+        create_repo(self.repo_dir, self.eggs + eggs2)
+        enpkg = self._enpkg()
+        enpkg.execute(self._actions())
+
+        # the last egg is only fetched once the first egg was installed
+        log = []
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            enpkg = Enpkg(BlockingStore(self.repo_dir, eggs2[-1], log),
+                          userpass=None, prefixes=[self.prefix],
+                          fetch_workers=1, pipeline=True)
+        install = enpkg.ec.install
+        def logging_install(egg, dir_path, extra_info=None):
+            log.append(('install', egg))
+            enpkg.remote.unblock.set()
+            install(egg, dir_path, extra_info)
+        enpkg.ec.install = logging_install
+
+        actions = enpkg.install_actions_batch(list('abcde'))
+        self.assertEqual(len([a for a in actions if a[0] == 'remove']), 5)
+        enpkg.execute(actions)
+        self.assertTrue(log.index(('install', eggs2[0])) <
+                        log.index(('fetched', eggs2[-1])))
+        self.eggs = eggs2
+        self._check_installed(enpkg)
+        self.assertFalse(enpkg.find('a-1.0-1.egg'))
+
+    def test_execute_levels(self):
+        create_repo(self.repo_dir, self.eggs, {'c': ['a'], 'e': ['c', 'd']})
+        enpkg = self._enpkg(install_workers=3)
+        enpkg._connect()
+        self.assertEqual(enpkg._schedule(self._actions())[5:],
+                         [('install', ['a-1.0-1.egg', 'b-1.0-1.egg',
+                                       'd-1.0-1.egg']),
+                          ('install', ['c-1.0-1.egg']),
+                          ('install', ['e-1.0-1.egg'])])
+        enpkg.execute(self._actions())
+        self._check_installed(enpkg)
+
+    def test_execute_level_hooks(self):
+        # the hook of a runs before c (which depends on a) is installed
+        paths = [join(self.prefix, 'a.hook'),
+                 join(self.prefix, rel_site_packages, 'c.py')]
+        create_repo(self.repo_dir, self.eggs, {'c': ['a']},
+                    lambda name: {'EGG-INFO/post_egginst.py':
+                                  HOOK % dict(name=name, paths=paths)})
+        enpkg = self._enpkg(install_workers=3)
+        enpkg.execute(self._actions())
+        self._check_installed(enpkg)
+        for name, res in [('a', 'False False'), ('c', 'True True')]:
+            with open(join(self.prefix, name + '.hook')) as fi:
+                self.assertEqual(fi.read(), res)
+
+    def test_install_actions_batch(self):
+        enpkg = self._enpkg()
+        actions = enpkg.install_actions_batch(['b', 'a'])
+        self.assertEqual(actions, [('fetch_0', 'a-1.0-1.egg'),
+                                   ('fetch_0', 'b-1.0-1.egg'),
+                                   ('install', 'a-1.0-1.egg'),
+                                   ('install', 'b-1.0-1.egg')])
+        enpkg.execute(enpkg.install_actions_batch(self.eggs))
+        self._check_installed(enpkg)
+        self.assertEqual(enpkg.install_actions_batch(['a', 'c']), [])
+        self.assertEqual(enpkg.install_actions_batch(['c'], force=True),
+                         [('fetch_1', 'c-1.0-1.egg'),
+                          ('remove', 'c-1.0-1.egg'),
+                          ('install', 'c-1.0-1.egg')])
+
+    def test_install_actions_batch_force(self):
+        # e requires the older version of c, which is reinstalled when forced
+        eggs2 = ['c-2.0-1.egg']
+        create_repo(self.repo_dir, self.eggs + eggs2, {'e': ['c 1.0-1']})
+        enpkg = self._enpkg(solver=True)
+        enpkg.execute(self._actions())
+        self.assertEqual(enpkg.install_actions_batch(['c', 'e'], force=True),
+                         [('fetch_1', 'c-1.0-1.egg'),
+                          ('fetch_1', 'e-1.0-1.egg'),
+                          ('remove', 'e-1.0-1.egg'),
+                          ('remove', 'c-1.0-1.egg'),
+                          ('install', 'c-1.0-1.egg'),
+                          ('install', 'e-1.0-1.egg')])
+
+    def test_info_lists(self):
+        enpkg = self._enpkg()
+        info_lists = enpkg.info_lists()
+        self.assertEqual(sorted(info_lists), list('abcde'))
+        for name, info_list in info_lists.iteritems():
+            self.assertEqual([info['key'] for info in info_list],
+                             ['%s-1.0-1.egg' % name])
+            del info_list[0]['key']
+            self.assertEqual(info_list, enpkg.info_list_name(name))
@@ -0,0 +1,83 @@
+import shutil
+import tempfile
+import unittest
+from os.path import isfile, join
+
+from enstaller.store.indexed import LocalIndexedStore
+from enstaller.store.base import AbstractStore
+from enstaller.fetch import FetchAPI, FetchPool
+
+from egg_fixtures import create_repo
+
+
+class NoRangeStore(LocalIndexedStore):
+    get_partial_data = AbstractStore.get_partial_data.im_func
+
+
+class TestFetch(unittest.TestCase):
+
+    egg = 'a-1.0-1.egg'
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+        self.local_dir = tempfile.mkdtemp()
+        create_repo(self.repo_dir, [self.egg])
+        self.data = open(join(self.repo_dir, self.egg), 'rb').read()
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+        shutil.rmtree(self.local_dir)
+
+    def _fetch(self, remote, part_data):
+        with open(join(self.local_dir, self.egg + '.part'), 'wb') as fo:
+            fo.write(part_data)
+        remote.connect()
+        FetchAPI(remote, self.local_dir).fetch(self.egg)
+        self.assertEqual(open(join(self.local_dir, self.egg), 'rb').read(),
+                         self.data)
+        self.assertFalse(isfile(join(self.local_dir, self.egg + '.part')))
+
+    def test_resume(self):
+        self._fetch(LocalIndexedStore(self.repo_dir), self.data[:123])
+
+    def test_resume_ignored(self):
+        self._fetch(NoRangeStore(self.repo_dir), self.data[:123])
+
+    def test_resume_corrupt(self):
+        self.assertRaises(ValueError, self._fetch,
+                          LocalIndexedStore(self.repo_dir), 'X' * 123)
+        # the corrupted .part file is removed
+        self.assertFalse(isfile(join(self.local_dir, self.egg + '.part')))
+
+
+class TestFetchPool(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+        self.local_dir = tempfile.mkdtemp()
+        self.eggs = ['%s-1.0-1.egg' % n for n in 'abcdefgh']
+        create_repo(self.repo_dir, self.eggs)
+        self.remote = LocalIndexedStore(self.repo_dir)
+        self.remote.connect()
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+        shutil.rmtree(self.local_dir)
+
+    def test_fetch_all(self):
+        with FetchPool(self.remote, self.local_dir, max_workers=3) as pool:
+            for egg in self.eggs:
+                pool.submit(egg)
+            for egg in self.eggs:
+                pool.wait(egg)
+                self.assertTrue(isfile(join(self.local_dir, egg)))
+
+    def test_abort_on_failure(self):
+        self.remote.get_metadata('a-1.0-1.egg')['md5'] = 'wrong'
+        with FetchPool(self.remote, self.local_dir, max_workers=1) as pool:
+            for egg in self.eggs:
+                pool.submit(egg)
+            self.assertRaises(ValueError, pool.wait, 'a-1.0-1.egg')
+            # once a fetch failed, no new fetches are started
+            self.assertRaises(ValueError, pool.wait, 'h-1.0-1.egg')
+        self.assertFalse(isfile(join(self.local_dir, 'h-1.0-1.egg')))
@@ -0,0 +1,147 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import os.path as op
+
+from egginst.hooks import HookRunner
+from egginst.main import EggInst
+
+
+# writes the current directory and the arguments into out.txt
+HOOK = """\
+import os, sys
+with open('out.txt', 'w') as fo:
+    fo.write('%s %s' % (os.getcwd(), ' '.join(sys.argv[1:])))
+"""
+
+
+class TestHookRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def _hook(self, name, code):
+        dir_path = op.join(self.base_dir, name)
+        shutil.os.mkdir(dir_path)
+        path = op.join(dir_path, 'post_egginst.py')
+        with open(path, 'w') as fo:
+            fo.write(code)
+        return path
+
+    def _out(self, path):
+        return open(op.join(op.dirname(path), 'out.txt')).read()
+
+    def test_run(self):
+        a = self._hook('a', HOOK)
+        b = self._hook('b', HOOK)
+        with HookRunner() as hooks:
+            self.assertEqual(hooks.run(a, '/prefix/a'), 0)
+            self.assertEqual(hooks.run(b, '/prefix/b'), 0)
+        self.assertEqual(self._out(a), '%s --prefix /prefix/a' % op.dirname(a))
+        self.assertEqual(self._out(b), '%s --prefix /prefix/b' % op.dirname(b))
+
+    def test_errors(self):
+        paths = [self._hook('error', 'raise ValueError\n'),
+                 self._hook('exit', 'import sys; sys.exit(3)\n'),
+                 self._hook('kill', 'import os; os._exit(0)\n'),
+                 self._hook('ok', HOOK)]
+        with HookRunner() as hooks:
+            self.assertEqual([hooks.run(p, '/prefix') for p in paths],
+                             [1, 3, 1, 0])
+        self.assertEqual(self._out(paths[3]),
+                         '%s --prefix /prefix' % op.dirname(paths[3]))
+
+    def test_modules(self):
+        # modules imported by a hook are not seen by the next hook
+        a = self._hook('a', 'import mod_a\n')
+        with open(op.join(op.dirname(a), 'mod_a.py'), 'w') as fo:
+            fo.write('x = 1\n')
+        b = self._hook('b', "import sys\n"
+                            "sys.exit(int('mod_a' in sys.modules))\n")
+        with HookRunner() as hooks:
+            self.assertEqual(hooks.run(a, '/prefix'), 0)
+            self.assertEqual(hooks.run(b, '/prefix'), 0)
+
+    def test_state(self):
+        # changes to the environment, streams and exit functions made by a
+        # hook are not seen by the next hook
+        log = op.join(self.base_dir, 'log.txt')
+        a = self._hook('a', "import os, sys, atexit, signal\n"
+                            "os.environ['HOOK_A'] = '1'\n"
+                            "sys.stdout = open(%r, 'w')\n"
+                            "sys.path.append('/hook/a')\n"
+                            "signal.signal(signal.SIGUSR1, signal.SIG_IGN)\n"
+                            "atexit.register(open(%r, 'w').write, 'a')\n"
+                            % (os.devnull, log))
+        b = self._hook('b', "import os, sys, signal as s\n"
+                            "sys.exit(int('HOOK_A' in os.environ) +\n"
+                            "    2 * int(sys.stdout is not sys.__stdout__) +\n"
+                            "    4 * int('/hook/a' in sys.path) +\n"
+                            "    8 * (s.getsignal(s.SIGUSR1) == s.SIG_IGN))\n")
+        with HookRunner() as hooks:
+            self.assertEqual(hooks.run(a, '/prefix'), 0)
+            self.assertEqual(open(log).read(), 'a')
+            self.assertEqual(hooks.run(b, '/prefix'), 0)
+
+    def test_defer(self):
+        a = self._hook('a', HOOK)
+        with HookRunner() as hooks:
+            hooks.defer(a, '/prefix')
+            self.assertFalse(op.exists(op.join(op.dirname(a), 'out.txt')))
+            hooks.flush()
+            self.assertTrue(op.exists(op.join(op.dirname(a), 'out.txt')))
+
+    def test_flush_order(self):
+        log = op.join(self.base_dir, 'log.txt')
+        code = "open(%r, 'a').write(%r)\n"
+        paths = [self._hook(name, code % (log, name + '\n'))
+                 for name in 'abc']
+        with HookRunner() as hooks:
+            for key, path in zip(['c.egg', 'a.egg', 'b.egg'], paths):
+                hooks.defer(path, '/prefix', key)
+            hooks.flush(['a.egg', 'b.egg', 'c.egg'])
+        self.assertEqual(open(log).read().split(), ['b', 'c', 'a'])
+
+    def test_stdin(self):
+        # hooks reading stdin do not get the commands of the helper
+        a = self._hook('a', "import sys\n"
+                            "sys.exit(len(sys.stdin.read()))\n")
+        b = self._hook('b', HOOK)
+        with HookRunner() as hooks:
+            self.assertEqual(hooks.run(a, '/prefix'), 0)
+            self.assertEqual(hooks.run(b, '/prefix'), 0)
+        self.assertEqual(self._out(b), '%s --prefix /prefix' % op.dirname(b))
+
+
+class TestEggInstHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.egg_path = op.join(self.base_dir, "foo-1.0-1.egg")
+        with zipfile.ZipFile(self.egg_path, "w") as fp:
+            fp.writestr("foo.py", "")
+            fp.writestr("EGG-INFO/post_egginst.py", HOOK)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def test_install(self):
+        prefix = op.join(self.base_dir, "prefix")
+        with HookRunner() as hooks:
+            installer = EggInst(self.egg_path, prefix=prefix)
+            installer.hooks = hooks
+            installer.install()
+            out = op.join(installer.meta_dir, 'out.txt')
+            self.assertFalse(op.exists(out))
+        self.assertEqual(open(out).read(), '%s --prefix %s' %
+                         (installer.meta_dir, installer.prefix))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import shutil
+import tempfile
+import unittest
+from os.path import isfile, join
+
+from egginst.installdb import InstallDB
+from egginst.main import EggInst, get_installed
+from enstaller.eggcollect import EggCollection
+from egginst.utils import rm_rf
+
+from egg_fixtures import create_egg
+
+
+class TestInstallDB(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.prefix = join(self.base_dir, 'prefix')
+        self.egginfo_dir = join(self.prefix, 'EGG-INFO')
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def _install(self, name, hook=False):
+        path = join(self.base_dir, '%s-1.0-1.egg' % name)
+        create_egg(path, name)
+        EggInst(path, prefix=self.prefix, hook=hook).install()
+
+    def _remove(self, name, hook=False):
+        EggInst('%s-1.0-1.egg' % name, prefix=self.prefix, hook=hook).remove()
+
+    def test_install_remove(self):
+        for name in 'abc':
+            self._install(name)
+        db = InstallDB(self.egginfo_dir)
+        self.assertTrue(isfile(db.path))
+        entries = db.entries()
+        self.assertEqual(sorted(entries), ['a', 'b', 'c'])
+        self.assertEqual(entries['b']['egg_name'], 'b-1.0-1.egg')
+        self.assertEqual(entries['b']['info']['key'], 'b-1.0-1.egg')
+        self.assertEqual(list(get_installed(self.prefix)),
+                         ['a-1.0-1.egg', 'b-1.0-1.egg', 'c-1.0-1.egg'])
+
+        self._remove('b')
+        self.assertEqual(sorted(db.entries()), ['a', 'c'])
+        self._remove('a')
+        self._remove('c')
+        self.assertEqual(db.entries(), {})
+        self.assertFalse(isfile(db.path))
+
+    def test_not_rebuilt(self):
+        for name in 'ab':
+            self._install(name)
+        db = InstallDB(self.egginfo_dir)
+        # the meta data files are not read, when the database is current
+        def read_entry(fn):
+            raise AssertionError("entry %r read" % fn)
+        db._read_entry = read_entry
+        self.assertEqual(db.entries()['a']['info']['key'], 'a-1.0-1.egg')
+
+    def test_changed_entry(self):
+        for name in 'ab':
+            self._install(name)
+        db = InstallDB(self.egginfo_dir)
+        db.entries()
+        # an _info.json rewritten in place (by other means) is read again
+        with open(join(self.egginfo_dir, 'a', '_info.json'), 'w') as fo:
+            json.dump(dict(key='x-1.0-1.egg'), fo)
+        self.assertEqual(db.entries()['a']['info']['key'], 'x-1.0-1.egg')
+        self._remove('b')
+        self.assertEqual(InstallDB(self.egginfo_dir).entries()['a']['info'],
+                         dict(key='x-1.0-1.egg'))
+
+    def test_rebuild(self):
+        for name in 'abc':
+            self._install(name)
+        db = InstallDB(self.egginfo_dir)
+        db.entries()
+        # remove a package without updating the database
+        rm_rf(join(self.egginfo_dir, 'b'))
+        self.assertEqual(sorted(db.entries()), ['a', 'c'])
+        self.assertEqual(sorted(InstallDB(self.egginfo_dir).entries()),
+                         ['a', 'c'])
+        # a missing database is rebuilt
+        rm_rf(db.path)
+        self.assertEqual(list(get_installed(self.prefix)),
+                         ['a-1.0-1.egg', 'c-1.0-1.egg'])
+        self.assertTrue(isfile(db.path))
+
+    def test_egg_collection(self):
+        for hook in False, True:
+            for name in 'ab':
+                self._install(name, hook)
+            ec = EggCollection(self.prefix, hook)
+            self.assertEqual([key for key, info in ec.query()],
+                             ['a-1.0-1.egg', 'b-1.0-1.egg'])
+            index = dict(ec.query(name='b'))
+            self.assertEqual(index.keys(), ['b-1.0-1.egg'])
+            info = index['b-1.0-1.egg']
+            self.assertTrue(info['installed'])
+            self.assertEqual(info['meta_dir'], ec.find('b-1.0-1.egg')['meta_dir'])
+            for name in 'ab':
+                self._remove(name, hook)
+            self.assertEqual(list(ec.query()), [])
+
+    def test_name_query(self):
+        for hook in False, True:
+            self._install('a', hook)
+            ec = EggCollection(self.prefix, hook)
+            info = dict(ec.query(name='a'))['a-1.0-1.egg']
+            self.assertEqual(len(ec._infos), 1)
+            info['name'] = 'foo'
+            # the cached info is not modified by the caller
+            self.assertEqual(dict(ec.query(name='a'))['a-1.0-1.egg']['name'],
+                             'a')
+            self.assertEqual(list(ec.query(name='b')), [])
+            self.assertEqual(len(ec._infos), 1)
+            # a changed _info.json is read again
+            path = join(info['meta_dir'], '_info.json')
+            with open(path, 'w') as fo:
+                json.dump(dict(key='a-1.0-1.egg', name='a', version='2.0'),
+                          fo)
+            self.assertEqual(ec.find('a-1.0-1.egg')['version'], '2.0')
+            self._remove('a', hook)
+            self.assertEqual(list(ec.query(name='a')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
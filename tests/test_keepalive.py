@@ -0,0 +1,79 @@
+import threading
+import unittest
+import urllib2
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from enstaller.store.keepalive import (ConnectionPool, KeepAliveHTTPHandler,
+                                       is_http_handler)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def do_GET(self):
+        self.connections.add(self.client_address)
+        body = 'data for %s' % self.path
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestKeepAlive(unittest.TestCase):
+
+    def setUp(self):
+        Handler.connections = set()
+        self.server = Server(('127.0.0.1', 0), Handler)
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.pool = ConnectionPool()
+        self.opener = urllib2.build_opener(KeepAliveHTTPHandler(self.pool))
+
+    def tearDown(self):
+        self.pool.close_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        for key in 'a', 'b', 'c':
+            fp = self.opener.open(self.url + key)
+            self.assertEqual(fp.read(), 'data for /%s' % key)
+            fp.close()
+        self.assertEqual(len(Handler.connections), 1)
+
+    def test_chunked_read(self):
+        for key in 'ab', 'cd':
+            fp = self.opener.open(self.url + key)
+            data = ''
+            while True:
+                chunk = fp.read(3)
+                if not chunk:
+                    break
+                data += chunk
+            self.assertEqual(data, 'data for /%s' % key)
+        self.assertEqual(len(Handler.connections), 1)
+
+    def test_stale_connection(self):
+        self.opener.open(self.url + 'a').read()
+        # close the idle connection behind the pool's back
+        for conns in self.pool._idle.itervalues():
+            for conn in conns:
+                conn.sock.close()
+        self.assertEqual(self.opener.open(self.url + 'b').read(),
+                         'data for /b')
+
+    def test_is_http_handler(self):
+        self.assertTrue(is_http_handler(urllib2.HTTPHandler))
+        self.assertTrue(is_http_handler(urllib2.HTTPSHandler()))
+        self.assertFalse(is_http_handler(urllib2.ProxyHandler))
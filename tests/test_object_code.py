@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import os.path as op
+
+from egginst import object_code
+from egginst.main import EggInst
+
+
+PLACEHOLDER = 8 * '/PLACEHOLD'
+
+ELF_DATA = ('\x7fELF' + 100 * '\x01' + PLACEHOLDER + '\0' + 50 * '\x02' +
+            PLACEHOLDER + ':/opt/lib\0' + 20 * '\x03')
+
+
+class TestFixObjectCode(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self._targets = object_code._targets
+        object_code._targets = ['/usr/local/lib']
+
+    def tearDown(self):
+        object_code._targets = self._targets
+        shutil.rmtree(self.base_dir)
+
+    def test_find_placeholders(self):
+        data = 'x' + ELF_DATA + 3 * '/PLACEHOLD' + '\0' + PLACEHOLDER + ' \0'
+        self.assertEqual(
+            [m.span() for m in object_code.find_placeholders(data)],
+            [m.span() for m in object_code.placehold_pat.finditer(data)])
+
+    def test_fix(self):
+        path = op.join(self.base_dir, 'libfoo.so')
+        with open(path, 'wb') as fo:
+            fo.write(ELF_DATA)
+        object_code.fix_object_code(path)
+        data = open(path, 'rb').read()
+        self.assertEqual(len(data), len(ELF_DATA))
+        self.assertFalse('/PLACEHOLD' in data)
+        self.assertTrue('/usr/local/lib\0' in data)
+        self.assertTrue('/usr/local/lib:/opt/lib\0' in data)
+
+    def test_empty(self):
+        path = op.join(self.base_dir, 'libempty.so')
+        open(path, 'wb').close()
+        object_code.fix_object_code(path, 'ELF')
+        self.assertEqual(os.path.getsize(path), 0)
+
+
+class TestEggInstObjectTypes(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.egg_path = op.join(self.base_dir, "foo-1.0-1.egg")
+        with zipfile.ZipFile(self.egg_path, "w", zipfile.ZIP_DEFLATED) as fp:
+            fp.writestr("EGG-INFO/usr/lib/libfoo.so", ELF_DATA)
+            fp.writestr("EGG-INFO/usr/lib/foo.txt", PLACEHOLDER + '\0')
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def test_install(self):
+        prefix = op.join(self.base_dir, "prefix")
+        installer = EggInst(self.egg_path, prefix=prefix)
+        installer.install()
+        lib = op.join(prefix, "lib", "libfoo.so")
+        txt = op.join(prefix, "lib", "foo.txt")
+        self.assertEqual(installer.object_types[lib], 'ELF')
+        self.assertEqual(installer.object_types[txt], None)
+        data = open(lib, 'rb').read()
+        self.assertTrue(op.join(prefix, "lib") + '\0' in data)
+        self.assertFalse('/PLACEHOLD' in data)
+        self.assertEqual(open(txt, 'rb').read(), PLACEHOLDER + '\0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from BaseHTTPServer import HTTPServer
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from os.path import isfile, join
+
+from enstaller.egg_meta import update_index
+from enstaller.store.indexed import (RemoteHTTPIndexedStore,
+                                     ShardedHTTPIndexedStore)
+
+from egg_fixtures import create_egg
+
+
+def _create_egg(repo_dir, name, version, packages=[]):
+    create_egg(join(repo_dir, '%s-%s-1.egg' % (name, version)), name,
+               version, packages)
+
+
+class Handler(SimpleHTTPRequestHandler):
+    paths = []
+    # list of the headers (as dictionaries) of the requests
+    request_headers = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        self.request_headers.append(dict(self.headers.items()))
+        SimpleHTTPRequestHandler.do_GET(self)
+
+    def translate_path(self, path):
+        path = path.split('?')[0]
+        return join(self.server.repo_dir, path.lstrip('/'))
+
+    def end_headers(self):
+        path = self.translate_path(self.path)
+        if isfile(path):
+            self.send_header('Etag', hashlib.md5(open(path).read()).hexdigest())
+        SimpleHTTPRequestHandler.end_headers(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RepoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.repo_dir = join(self.base_dir, 'repo')
+        os.mkdir(self.repo_dir)
+        _create_egg(self.repo_dir, 'numpy', '1.6.0')
+        _create_egg(self.repo_dir, 'numpy', '1.7.0')
+        _create_egg(self.repo_dir, 'scipy', '0.11.0', ['numpy 1.7.0'])
+        _create_egg(self.repo_dir, 'PIL', '1.1.7')
+        update_index(self.repo_dir)
+
+        Handler.paths = []
+        Handler.request_headers = []
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.repo_dir = self.repo_dir
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.base_dir)
+
+
+class TestPartial(RepoTestCase):
+
+    def test_identity(self):
+        # the range refers to the data as stored, so it is not compressed
+        store = RemoteHTTPIndexedStore(self.url, join(self.base_dir, 'c'))
+        store.connect()
+        fp, offset = store.get_partial_data('PIL-1.1.7-1.egg', 5)
+        data = fp.read()
+        fp.close()
+        headers = Handler.request_headers[-1]
+        self.assertEqual(headers['range'], 'bytes=5-')
+        self.assertEqual(headers['accept-encoding'], 'identity')
+        path = join(self.repo_dir, 'PIL-1.1.7-1.egg')
+        self.assertEqual(data, open(path, 'rb').read()[offset:])
+
+
+class TestSharded(RepoTestCase):
+
+    def _store(self):
+        store = ShardedHTTPIndexedStore(self.url, join(self.base_dir, 'c'))
+        store.connect()
+        return store
+
+    def test_write_shards(self):
+        manifest = json.load(open(join(self.repo_dir, 'shards.json')))
+        self.assertEqual(sorted(manifest), ['numpy', 'pil', 'scipy'])
+        shard = json.load(open(join(self.repo_dir, 'shards', 'numpy.json')))
+        self.assertEqual(sorted(shard), ['numpy-1.6.0-1.egg',
+                                         'numpy-1.7.0-1.egg'])
+
+    def test_lazy_query(self):
+        store = self._store()
+        keys = sorted(store.query_keys(type='egg', name='numpy'))
+        self.assertEqual(keys, ['numpy-1.6.0-1.egg', 'numpy-1.7.0-1.egg'])
+        self.assertEqual(store.get_metadata('PIL-1.1.7-1.egg')['name'],
+                         'pil')
+        self.assertFalse(store.exists('foo-1.0-1.egg'))
+        self.assertEqual(sorted(Handler.paths),
+                         ['/shards.json', '/shards/numpy.json',
+                          '/shards/pil.json'])
+
+    def test_shard_cache(self):
+        list(self._store().query(name='scipy'))
+        Handler.paths = []
+        info = dict(self._store().query(name='scipy'))['scipy-0.11.0-1.egg']
+        self.assertEqual(info['packages'], ['numpy 1.7.0'])
+        self.assertEqual(Handler.paths, ['/shards.json'])
+
+    def test_query_all(self):
+        store = self._store()
+        self.assertEqual(len(list(store.query(type='egg'))), 4)
+        self.assertEqual(Handler.paths[-1], '/index.json?pypi=true')
+
+
+class TestDeltas(RepoTestCase):
+
+    def _store(self, deltas=True):
+        store = RemoteHTTPIndexedStore(self.url, join(self.base_dir, 'c'),
+                                       deltas)
+        store.connect()
+        return store
+
+    def test_write_deltas(self):
+        md5 = hashlib.md5(open(join(self.repo_dir, 'index.json'),
+                               'rb').read()).hexdigest()
+        _create_egg(self.repo_dir, 'numpy', '1.8.0')
+        os.unlink(join(self.repo_dir, 'PIL-1.1.7-1.egg'))
+        update_index(self.repo_dir)
+        delta = json.load(open(join(self.repo_dir, 'deltas', md5 + '.json')))
+        self.assertEqual(sorted(delta['changed']), ['numpy-1.8.0-1.egg'])
+        self.assertEqual(delta['removed'], ['PIL-1.1.7-1.egg'])
+
+    def test_rolling_history(self):
+        for i in xrange(15):
+            _create_egg(self.repo_dir, 'foo', '1.%d' % i)
+            update_index(self.repo_dir)
+        # 10 deltas and the empty delta of the current index
+        self.assertEqual(len(os.listdir(join(self.repo_dir, 'deltas'))), 11)
+
+    def test_update_from_deltas(self):
+        self.assertEqual(len(list(self._store().query())), 4)
+        for version in '1.8.0', '1.9.0':
+            _create_egg(self.repo_dir, 'numpy', version)
+            update_index(self.repo_dir)
+
+        Handler.paths = []
+        store = self._store()
+        self.assertTrue(store.exists('numpy-1.9.0-1.egg'))
+        self.assertEqual(len(list(store.query())), 6)
+        # the index itself was not fetched again
+        self.assertTrue(all(p.startswith('/deltas/') for p in Handler.paths))
+        self.assertEqual(len(Handler.paths), 3)
+
+    def test_no_deltas(self):
+        self._store()
+        shutil.rmtree(join(self.repo_dir, 'deltas'))
+        _create_egg(self.repo_dir, 'numpy', '1.8.0')
+        update_index(self.repo_dir, deltas=False)
+        self.assertTrue(self._store().exists('numpy-1.8.0-1.egg'))
+
+    def test_repo_without_deltas(self):
+        self._store(deltas=False)
+        _create_egg(self.repo_dir, 'numpy', '1.8.0')
+        update_index(self.repo_dir)
+        Handler.paths = []
+        self.assertTrue(self._store(deltas=False).exists('numpy-1.8.0-1.egg'))
+        # no deltas were asked for
+        self.assertEqual(Handler.paths, ['/index.json?pypi=true'])
+
+    def test_malformed_delta(self):
+        md5 = hashlib.md5(open(join(self.repo_dir, 'index.json'),
+                               'rb').read()).hexdigest()
+        self._store()
+        _create_egg(self.repo_dir, 'numpy', '1.8.0')
+        update_index(self.repo_dir)
+        for data in '<html>Not found</html>', '{"changed": {}}', '[]':
+            with open(join(self.repo_dir, 'deltas', md5 + '.json'),
+                      'w') as fo:
+                fo.write(data)
+            store = self._store()
+            self.assertTrue(store.exists('numpy-1.8.0-1.egg'))
+            self._store(deltas=False)
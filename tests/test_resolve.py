@@ -6,7 +6,9 @@ from enstaller.store.indexed import IndexedStore
 from enstaller.store.joined import JoinedStore
 
 from enstaller import resolve
-from enstaller.resolve import Resolve, Req
+from enstaller.enpkg import EnpkgError
+from enstaller.resolve import Resolve, Req, comparable_info
+from enstaller.solver import Solver
 from enstaller.indexed_repo.metadata import parse_depend_index
 
 
@@ -109,6 +111,20 @@ class TestReq(unittest.TestCase):
         self.assertEqual(Req('foo').matches(spec26), True)
 
 
+class TestComparableInfo(unittest.TestCase):
+
+    def test_comparable_info(self):
+        spec = dict(version='1.3.0rc1', build=2)
+        key = comparable_info(spec)
+        self.assert_(key < comparable_info(dict(version='1.3.0', build=1)))
+        self.assert_(key > comparable_info(dict(version='1.3.0b3', build=4)))
+        spec['sort_key'] = key
+        self.assert_(comparable_info(spec) is key)
+        # the stored key is ignored, when it was converted to a list
+        spec = dict(version='1.3.0rc1', build=2, sort_key=[[1], 2])
+        self.assertEqual(comparable_info(spec), key)
+
+
 class TestChain0(unittest.TestCase):
 
     r = JoinedStore([
@@ -204,6 +220,111 @@ class TestChain1(unittest.TestCase):
                           'scipy-0.9.0-1.egg'])
 
 
+class CountingStore(DummyStore):
+
+    def __init__(self, index_path, name=None):
+        DummyStore.__init__(self, index_path, name)
+        self.queried = []
+
+    def query(self, **kwargs):
+        self.queried.append(kwargs.get('name'))
+        return DummyStore.query(self, **kwargs)
+
+
+class TestMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.r = CountingStore(join(this_dir, 'epd', 'index-7.1.txt'))
+        self.r.connect()
+        self.c = Resolve(self.r)
+
+    def test_candidates(self):
+        lst = self.c.candidates('swig')
+        self.assertEqual(lst[0][0], 'swig-1.3.40-2.egg')
+        self.assertEqual(sorted(lst), sorted(self.r.query(name='swig')))
+        self.assert_(self.c.candidates('swig') is lst)
+        self.assertEqual(self.c.candidates('foobar'), [])
+
+    def test_query_once(self):
+        resolve.PY_VER = '2.7'
+        for req_string in 'swig', 'swig 1.3.36', 'swig', 'swig 1.3.40-1':
+            self.c.get_egg(Req(req_string))
+        self.assertEqual(self.r.queried, ['swig'])
+
+    def test_same_results(self):
+        resolve.PY_VER = '2.7'
+        for req_string in ('numpy', 'scipy', 'swig 1.3.36', 'foobar'):
+            req = Req(req_string)
+            egg = self.c.get_egg(req)
+            self.assertEqual(self.c.get_egg(req), egg)
+            self.assertEqual(Resolve(self.r).get_egg(req), egg)
+        self.assertEqual(self.c.install_sequence(Req('scipy')),
+                         Resolve(self.r).install_sequence(Req('scipy')))
+
+    def test_batch(self):
+        resolve.PY_VER = '2.7'
+        batch = lambda rs, mode='recur': self.c.install_sequence_batch(
+            [Req(s) for s in rs], mode)
+        self.assertEqual(batch(['numpy']), eggs_rs(self.c, 'numpy'))
+        self.assertEqual(batch(['swig', 'numpy']),
+                         ['MKL-10.3-1.egg', 'numpy-1.6.0-3.egg',
+                          'swig-1.3.40-2.egg'])
+        # scipy requires numpy 1.5.1, which is more strict than numpy
+        self.assertEqual(batch(['numpy', 'scipy']),
+                         eggs_rs(self.c, 'scipy'))
+        self.assertEqual(batch(['scipy', 'numpy 1.6.0']),
+                         ['MKL-10.3-1.egg', 'numpy-1.6.0-3.egg',
+                          'scipy-0.9.0-1.egg'])
+        self.assertEqual(batch(['numpy', 'swig 1.3.36'], 'root'),
+                         ['numpy-1.6.0-3.egg', 'swig-1.3.36-3.egg'])
+        self.assertEqual(batch(['numpy', 'foobar']), None)
+
+
+class TestSolver(unittest.TestCase):
+
+    r = TestChain1.r
+
+    def setUp(self):
+        resolve.PY_VER = '2.7'
+        self.c = Resolve(self.r)
+
+    def test_greedy_inconsistent(self):
+        # larry requires numpy 1.5.1 and h5py 1.3.1, the latest build of
+        # which requires numpy 1.6.0
+        req = Req('larry')
+        root = self.c.get_egg(req)
+        eggs = self.c._sequence_greedy([root], [req])
+        self.assert_('h5py-1.3.1-2.egg' in eggs)
+        self.assertFalse(self.c.is_consistent(eggs, [req]))
+        self.assertEqual(self.c.install_sequence(req),
+                         ['MKL-10.3-1.egg', 'numpy-1.5.1-2.egg',
+                          'h5py-1.3.1-1.egg', 'larry-0.4.0-2.egg'])
+
+    def test_backtrack_root(self):
+        # scikits.learn 0.8 requires numpy 1.6.0, but also scipy, which
+        # requires numpy 1.5.1
+        for solver in False, True:
+            c = Resolve(self.r, solver=solver)
+            eggs = c.install_sequence(Req('scikits.learn'))
+            self.assertEqual(eggs, ['MKL-10.3-1.egg', 'numpy-1.5.1-2.egg',
+                                    'scikits.learn-0.7.1-1.egg'])
+            self.assert_(c.is_consistent(eggs))
+
+    def test_consistent(self):
+        c = Resolve(self.r, solver=True)
+        for rs in 'numpy', 'scipy', 'swig 1.3.36':
+            self.assertEqual(c.install_sequence(Req(rs)),
+                             self.c.install_sequence(Req(rs)))
+
+    def test_unsatisfiable(self):
+        reqs = [Req('numpy 1.6.0'), Req('scipy')]
+        solver = Solver(self.c)
+        self.assertEqual(solver.solve(reqs), None)
+        self.assert_(frozenset() in solver.nogoods)
+        c = Resolve(self.r, solver=True)
+        self.assertRaises(EnpkgError, c.install_sequence_batch, reqs)
+
+
 class TestChain2(unittest.TestCase):
 
     r = JoinedStore([
@@ -2,7 +2,8 @@ import random
 import unittest
 
 from egginst.main import name_version_fn
-from enstaller.utils import canonical, comparable_version
+from enstaller.utils import (canonical, comparable_version, install_levels,
+                             install_order, version_key)
 
 
 class TestUtils(unittest.TestCase):
@@ -40,6 +41,75 @@ class TestUtils(unittest.TestCase):
             random.shuffle(versions)
             versions.sort(key=comparable_version)
             self.assertEqual(versions, org)
+            random.shuffle(versions)
+            versions.sort(key=version_key)
+            self.assertEqual(versions, org)
+
+    def test_version_key(self):
+        key = version_key('1.3.0')
+        self.assert_(type(key) is tuple)
+        self.assert_(version_key('1.3.0') is key)
+        self.assertEqual(version_key('1.3'), key)
+        # versions which can not be normalized sort before the others
+        self.assert_(version_key('2010b') < version_key('0.1'))
+
+
+def old_install_order(deps):
+    # the order determined by repeated passes, as install_order used to
+    names = sorted(deps)
+    result = []
+    while len(result) < len(names):
+        for name in names:
+            if name not in result and all(n in result for n in deps[name]):
+                result.append(name)
+    return result
+
+
+class TestInstallOrder(unittest.TestCase):
+
+    def order(self, deps):
+        return install_order(deps, lambda n: n, lambda n: deps[n])
+
+    def test_simple(self):
+        deps = {'a': ['c'], 'c': [], 'd': []}
+        self.assertEqual(self.order(deps), ['c', 'd', 'a'])
+        deps = {'scipy': ['numpy', 'mkl'], 'numpy': ['mkl'], 'mkl': []}
+        self.assertEqual(self.order(deps), ['mkl', 'numpy', 'scipy'])
+        self.assertEqual(self.order({}), [])
+
+    def test_random(self):
+        for n in xrange(100):
+            names = ['n%02d' % i for i in xrange(random.randint(1, 30))]
+            random.shuffle(names)
+            # requirements only point to names earlier in the shuffled
+            # list, such that the graph is acyclic
+            deps = dict((name, random.sample(names[:i],
+                                             random.randint(0, min(i, 3))))
+                        for i, name in enumerate(names))
+            self.assertEqual(self.order(deps), old_install_order(deps))
+
+    def test_cycle(self):
+        deps = {'a': [], 'b': ['d'], 'c': ['b'], 'd': ['c'], 'e': ['d']}
+        try:
+            self.order(deps)
+        except Exception, e:
+            self.assertEqual(str(e), "Loop in dependency graph: "
+                                     "b -> d -> c -> b")
+        else:
+            self.fail("Exception expected")
+
+        deps = {'a': ['a']}
+        self.assertRaises(Exception, self.order, deps)
+
+    def test_levels(self):
+        deps = {'a': ['c'], 'c': [], 'd': [], 'e': ['a']}
+        items = self.order(deps)
+        # names which are not among the items are ignored
+        deps['e'].append('numpy')
+        self.assertEqual(install_levels(items, lambda n: n,
+                                        lambda n: deps[n]),
+                         [['c', 'd'], ['a'], ['e']])
+        self.assertEqual(install_levels([], None, None), [])
 
 
 if __name__ == '__main__':